@@ -1,64 +1,94 @@
+import asyncio
 import json
+from typing import AsyncIterator, Optional
+
+import numpy as np
+
+from context_packer import ContextPacker
 from llm_client import LLMClient
+from intent_router import IntentRouter
 
 class RouterAgent:
-    def __init__(self, llm_client: LLMClient):
-        self.llm = llm_client
-
-    def route_query(self, query: str) -> str:
-        """
-        Decides if the query needs RAG research or is a simple conversational greeting/chitchat.
-        Returns: "RAG_RESEARCH" or "DIRECT_ANSWER"
-        """
-        system_prompt = """
+    SYSTEM_PROMPT = """
         You are an intent classifier for a medical AI.
         Classify the user's query into one of two categories:
-        
+
         1. "RAG_RESEARCH": Steps needed to answer medical, biological, health, or factual questions.
         2. "DIRECT_ANSWER": For greetings, compliments, "who are you", or simple queries not needing external retrieval.
-        
+
         OUTPUT FORMAT:
         { "intent": "RAG_RESEARCH" } or { "intent": "DIRECT_ANSWER" }
         """
-        
-        result = self.llm.invoke_agent(system_prompt, query)
-        return result.get("intent", "RAG_RESEARCH") # Default to research for safety
 
-class RetrievalAgent:
-    def __init__(self, llm_client: LLMClient):
+    def __init__(self, llm_client: LLMClient, local_router: Optional[IntentRouter] = None):
         self.llm = llm_client
-        
-    def generate_queries(self, query: str) -> list:
+        # Embedding classifier tried before the LLM; None disables it
+        self.local_router = local_router
+
+    def route_query(self, query: str) -> str:
         """
-        Generates optimized search queries for the RAG engine.
+        Decides if the query needs RAG research or is a simple conversational greeting/chitchat.
+        Returns: "RAG_RESEARCH" or "DIRECT_ANSWER"
         """
-        system_prompt = """
+        if self.local_router:
+            intent = self.local_router.classify(query)
+            if intent:
+                return intent
+
+        result = self.llm.invoke_agent(self.SYSTEM_PROMPT, query)
+        return result.get("intent", "RAG_RESEARCH") # Default to research for safety
+
+    async def aroute_query(self, query: str, query_vector: Optional[np.ndarray] = None) -> str:
+        """
+        Async variant of route_query. Pass the query's embedding if it has been
+        computed already; the local router then needs no encoder call of its own.
+        """
+        if self.local_router:
+            if query_vector is not None:
+                # A matrix product against the prototypes, no forward pass
+                intent = self.local_router.classify_vector(query_vector)
+            else:
+                intent = await asyncio.to_thread(self.local_router.classify, query)
+            if intent:
+                return intent
+
+        result = await self.llm.ainvoke_agent(self.SYSTEM_PROMPT, query)
+        return result.get("intent", "RAG_RESEARCH") # Default to research for safety
+
+class RetrievalAgent:
+    SYSTEM_PROMPT = """
         You are a medical search expert.
         Generate 3 diverse search queries to retrieve relevant medical information for the user's request.
         Focus on medical terminology, synonyms, and related conditions.
-        
+
         OUTPUT FORMAT:
         { "queries": ["query 1", "query 2", "query 3"] }
         """
-        
-        result = self.llm.invoke_agent(system_prompt, query)
-        return result.get("queries", [query])
 
-class AnswerAgent:
     def __init__(self, llm_client: LLMClient):
         self.llm = llm_client
-        
-    def generate_response(self, query: str, context: list, risk_level: str, intent: str = "RAG_RESEARCH") -> dict:
+
+    def generate_queries(self, query: str) -> list:
         """
-        Synthesizes the final answer using retrieved context and risk awareness.
+        Generates optimized search queries for the RAG engine.
         """
-        
-        if intent == "DIRECT_ANSWER":
-            system_prompt = """
+        result = self.llm.invoke_agent(self.SYSTEM_PROMPT, query)
+        return result.get("queries", [query])
+
+    async def agenerate_queries(self, query: str) -> list:
+        """Async variant of generate_queries."""
+        result = await self.llm.ainvoke_agent(self.SYSTEM_PROMPT, query)
+        return result.get("queries", [query])
+
+class AnswerAgent:
+    # Answer fields streamed to the client token by token
+    STREAM_FIELDS = ("answer_summary", "detailed_explanation")
+
+    DIRECT_PROMPT = """
             You are a helpful, friendly healthcare assistant.
             The user has asked a conversational question (greeting, identity, etc.).
             Answer politely and professionally. Do not make up medical facts.
-            
+
             OUTPUT JSON:
             {
                 "answer_summary": "Your polite response.",
@@ -67,31 +97,76 @@ class AnswerAgent:
                 "evidence_used": []
             }
             """
-            return self.llm.invoke_agent(system_prompt, query)
 
-        # RAG RESEARCH MODE
-        context_str = "\n\n".join([f"Source ({c['source']}): {c['content']}" for c in context])
-        
-        system_prompt = f"""
+    # Identical for every research query, so Ollama can reuse its evaluated
+    # prefix from the previous request; everything per-request goes in the user message
+    RAG_PROMPT = """
         You are a safe, evidence-based healthcare assistant.
-        Risk Level of Query: {risk_level}
-        
+
         GOAL: Answer using ONLY the provided document context.
-        
+
         RULES:
         1. DO NOT provide medical diagnosis or treatment.
         2. If evidence is insufficient, state that clearly.
         3. Cite sources specifically (e.g., "(WHO, 2024)").
         4. Maintain a professional, empathetic tone.
-        
+        5. Take the risk level of the query into account.
+
         OUTPUT JSON:
-        {{
+        {
             "answer_summary": "Concise answer (max 3 sentences).",
             "detailed_explanation": "Thorough explanation with citations.",
             "confidence_score": "High/Medium/Low",
             "evidence_used": ["List of facts/quotes used"]
-        }}
+        }
         """
-        
-        user_msg = f"Query: {query}\n\nDocument Context:\n{context_str}"
+
+    def __init__(self, llm_client: LLMClient, packer: Optional[ContextPacker] = None):
+        self.llm = llm_client
+        # Dedupes and trims the context to a token budget; None uses every chunk
+        self.packer = packer
+
+    def pack_context(self, context: list, vectors: Optional[np.ndarray] = None) -> list:
+        """
+        Returns the retrieved chunks that go into the answer prompt, best first.
+        `vectors` holds the stored embeddings of the chunks, row for row, which
+        the packer uses to spot near-duplicates.
+        """
+        if not self.packer:
+            return context
+        return self.packer.pack(context, vectors)
+
+    def build_prompt(self, query: str, context: list, risk_level: str, intent: str = "RAG_RESEARCH") -> tuple:
+        """
+        Returns the (system_prompt, user_message) pair for the answer generation call.
+        `context` is put in the prompt as given; see pack_context.
+        """
+
+        if intent == "DIRECT_ANSWER":
+            return self.DIRECT_PROMPT, query
+
+        # RAG RESEARCH MODE
+        context_str = "\n\n".join(ContextPacker.format_chunk(c) for c in context)
+
+        user_msg = f"Risk Level of Query: {risk_level}\n\nQuery: {query}\n\nDocument Context:\n{context_str}"
+        return self.RAG_PROMPT, user_msg
+
+    def generate_response(self, query: str, context: list, risk_level: str, intent: str = "RAG_RESEARCH") -> dict:
+        """
+        Synthesizes the final answer using retrieved context and risk awareness.
+        """
+        system_prompt, user_msg = self.build_prompt(query, context, risk_level, intent)
         return self.llm.invoke_agent(system_prompt, user_msg)
+
+    async def agenerate_response(self, query: str, context: list, risk_level: str,
+                                 intent: str = "RAG_RESEARCH") -> dict:
+        """Async variant of generate_response."""
+        system_prompt, user_msg = self.build_prompt(query, context, risk_level, intent)
+        return await self.llm.ainvoke_agent(system_prompt, user_msg)
+
+    async def astream_response(self, query: str, context: list, risk_level: str,
+                               intent: str = "RAG_RESEARCH") -> AsyncIterator[dict]:
+        """Streaming variant of generate_response; see LLMClient.astream_agent for the events."""
+        system_prompt, user_msg = self.build_prompt(query, context, risk_level, intent)
+        async for event in self.llm.astream_agent(system_prompt, user_msg, self.STREAM_FIELDS):
+            yield event
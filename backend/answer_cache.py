@@ -0,0 +1,186 @@
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """
+    Response cache keyed by query embedding.
+
+    A lookup hits when a cached query with the same risk level has cosine
+    similarity >= `threshold` to the new one. Entries expire after
+    `ttl_seconds` and the least recently used entry is evicted beyond
+    `max_entries`. Every entry belongs to a corpus version; when the corpus
+    changes the whole cache is dropped, since cached answers may cite evidence
+    that is stale or missing. With `persist_path` set, the cache is reloaded
+    on startup; changes only mark it dirty, and a background thread writes it
+    out every `save_interval` seconds and on close(), so no request waits
+    for the file.
+    """
+
+    def __init__(self, threshold: float = 0.95, max_entries: int = 1000,
+                 ttl_seconds: float = 3600, persist_path: Optional[str] = None,
+                 save_interval: float = 10.0):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.save_interval = save_interval
+        self.corpus_version = None
+        self._entries = OrderedDict()  # id -> entry, least recently used first
+        self._next_id = 0
+        self._matrix = None  # Stacked embeddings of _entries, rebuilt on change
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        # Guards _entries against the saver thread; requests never contend for it
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._closed = threading.Event()
+
+        if self.persist_path:
+            self._load()
+            threading.Thread(target=self._save_periodically, name="answer-cache-save", daemon=True).start()
+
+    def lookup(self, embedding: np.ndarray, risk_level: str, corpus_version: str) -> Optional[dict]:
+        """Returns a copy of the cached response for a near-identical query, or None."""
+        with self._lock:
+            return self._lookup(embedding, risk_level, corpus_version)
+
+    def _lookup(self, embedding: np.ndarray, risk_level: str, corpus_version: str) -> Optional[dict]:
+        self._sync_version(corpus_version)
+        self._expire()
+
+        best_id = None
+        if self._entries:
+            if self._matrix is None:
+                self._matrix = np.stack([e["embedding"] for e in self._entries.values()])
+            similarities = self._matrix @ embedding
+            ids = list(self._entries)
+            for pos in np.argsort(similarities)[::-1]:
+                if similarities[pos] < self.threshold:
+                    break
+                if self._entries[ids[pos]]["risk_level"] == risk_level:
+                    best_id = ids[pos]
+                    break
+
+        if best_id is None:
+            self.misses += 1
+            return None
+
+        entry = self._entries[best_id]
+        self._entries.move_to_end(best_id)
+        self.hits += 1
+        self.saved_seconds += entry["latency"]
+        return copy.deepcopy(entry["response"])
+
+    def store(self, embedding: np.ndarray, risk_level: str, corpus_version: str,
+              response: dict, latency: float):
+        """Caches `response`, which took `latency` seconds to produce."""
+        entry = {
+            "embedding": np.asarray(embedding, dtype="float32"),
+            "risk_level": risk_level,
+            "response": copy.deepcopy(response),
+            "latency": latency,
+            "created": time.time(),
+        }
+        with self._lock:
+            self._sync_version(corpus_version)
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._changed()
+
+    def invalidate(self):
+        """Drops every cached response."""
+        with self._lock:
+            self._invalidate()
+
+    def close(self):
+        """Stops the background saver and writes out any unsaved changes."""
+        self._closed.set()
+        if self.persist_path:
+            self.save()
+
+    def _invalidate(self):
+        self._entries.clear()
+        self._changed()
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "corpus_version": self.corpus_version,
+        }
+
+    def _sync_version(self, corpus_version: str):
+        if corpus_version != self.corpus_version:
+            if self._entries:
+                print("Corpus changed, invalidating answer cache.")
+            self.corpus_version = corpus_version
+            self._invalidate()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [i for i, e in self._entries.items() if e["created"] < cutoff]
+        for i in expired:
+            del self._entries[i]
+        if expired:
+            self._changed()
+
+    def _changed(self):
+        self._matrix = None
+        self._dirty = True
+
+    def _save_periodically(self):
+        while not self._closed.wait(self.save_interval):
+            try:
+                self.save()
+            except Exception as e:
+                print(f"Saving the answer cache failed: {e}")
+
+    def save(self):
+        """Writes the cache to persist_path if it changed since the last save."""
+        with self._lock:
+            if not self._dirty:
+                return
+            # Entries are never modified once stored, so a shallow copy is a consistent view
+            entries = list(self._entries.values())
+            corpus_version = self.corpus_version
+            self._dirty = False
+        try:
+            self._write(corpus_version, entries)
+        except Exception:
+            self._dirty = True
+            raise
+
+    def _write(self, corpus_version: Optional[str], entries: list):
+        entries = [{**e, "embedding": e["embedding"].tolist()} for e in entries]
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"corpus_version": corpus_version, "entries": entries}, f)
+        os.replace(tmp_path, self.persist_path)
+
+    def _load(self):
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+
+        self.corpus_version = stored.get("corpus_version")
+        for e in stored.get("entries", []):
+            e["embedding"] = np.asarray(e["embedding"], dtype="float32")
+            self._entries[self._next_id] = e
+            self._next_id += 1
@@ -0,0 +1,164 @@
+"""
+Prompt size and prompt evaluation time of the answer generation call,
+before and after context packing.
+
+"before" is the earlier prompt layout: every retrieved chunk, with the
+query's risk level written into the system prompt. "after" is AnswerAgent's
+layout (static system prompt, risk level in the user message) with the
+context packed by ContextPacker. Chunks are retrieved per query the way the
+orchestrator does (the query plus expansions, top 3 each, merged), and the
+prompts of each layout are sent to the model in turn, with risk levels
+rotating between queries as in real traffic. The prompt_eval_count and
+prompt_eval_duration the model reports are collected.
+
+The corpus is synthetic, with --duplicate-fraction of its documents also
+stored under a second name, like a file uploaded twice. By default the model
+is FakeChatModel with a simulated prefix cache; pass --ollama to measure a
+real Ollama server (OLLAMA_HOST, --model).
+
+Usage (from backend/):
+    python -m benchmarks.context_packing [--chunks 2000] [--queries 50] [--budget 1000]
+                                         [--ollama] [--model llama3.1] [--output packing.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from typing import Dict, List
+
+import numpy as np
+
+from agents import AnswerAgent
+from benchmarks.e2e import WORDS, percentiles, synthetic_queries, write_corpus
+from benchmarks.fakes import FakeChatModel, HashingEncoder
+from context_packer import ContextPacker
+from llm_client import LLMClient
+from rag_engine import RAGEngine
+from safety import RiskLevel
+
+RISK_LEVELS = [RiskLevel.LOW, RiskLevel.MODERATE, RiskLevel.HIGH]
+
+
+def legacy_prompt(query: str, context: List[Dict], risk_level: str) -> tuple:
+    """The answer prompt as AnswerAgent built it before context packing."""
+    context_str = "\n\n".join([f"Source ({c['source']}): {c['content']}" for c in context])
+    system_prompt = f"""
+        You are a safe, evidence-based healthcare assistant.
+        Risk Level of Query: {risk_level}
+
+        GOAL: Answer using ONLY the provided document context.
+
+        RULES:
+        1. DO NOT provide medical diagnosis or treatment.
+        2. If evidence is insufficient, state that clearly.
+        3. Cite sources specifically (e.g., "(WHO, 2024)").
+        4. Maintain a professional, empathetic tone.
+
+        OUTPUT JSON:
+        {{
+            "answer_summary": "Concise answer (max 3 sentences).",
+            "detailed_explanation": "Thorough explanation with citations.",
+            "confidence_score": "High/Medium/Low",
+            "evidence_used": ["List of facts/quotes used"]
+        }}
+        """
+    return system_prompt, f"Query: {query}\n\nDocument Context:\n{context_str}"
+
+
+def duplicate_documents(data_dir: str, fraction: float, rng: random.Random):
+    names = sorted(os.listdir(data_dir))
+    for name in rng.sample(names, int(len(names) * fraction)):
+        shutil.copy(os.path.join(data_dir, name), os.path.join(data_dir, "copy_of_" + name))
+
+
+def expansions(query: str, rng: random.Random) -> List[str]:
+    """The query plus three reworded variants, standing in for RetrievalAgent's output."""
+    return [query] + [f"{' '.join(rng.sample(query.split()[-4:], 3))} {rng.choice(WORDS)}" for _ in range(3)]
+
+
+def run(model, prompts: List[tuple], packer: ContextPacker) -> Dict:
+    evaluated, seconds, estimated = [], [], []
+    for system_prompt, user_msg in [prompts[0]] + prompts:  # The first call warms the cache
+        metadata = model.invoke(LLMClient._messages(system_prompt, user_msg)).response_metadata
+        evaluated.append(metadata.get("prompt_eval_count") or 0)
+        seconds.append((metadata.get("prompt_eval_duration") or 0) / 1e9)
+        estimated.append(packer.count_tokens(system_prompt + user_msg))
+    return {
+        "prompt_tokens": round(float(np.mean(estimated[1:])), 1),
+        "prompt_eval_count": round(float(np.mean(evaluated[1:])), 1),
+        "prompt_eval": percentiles(seconds[1:]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000, help="Corpus size, in chunks")
+    parser.add_argument("--duplicate-fraction", type=float, default=0.2)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=1000, help="Context token budget")
+    parser.add_argument("--duplicate-threshold", type=float, default=0.95)
+    parser.add_argument("--ollama", action="store_true", help="Send the prompts to Ollama instead of the fake")
+    parser.add_argument("--model", default="llama3.1")
+    parser.add_argument("--num-predict", type=int, default=16, help="Answer tokens generated per call")
+    parser.add_argument("--prompt-tokens-per-sec", type=float, default=2000.0,
+                        help="Simulated prompt evaluation rate of the fake model")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    if args.ollama:
+        from langchain_ollama import ChatOllama
+        model = ChatOllama(model=args.model, temperature=0.2, format="json", num_predict=args.num_predict,
+                           base_url=os.getenv("OLLAMA_HOST"))
+    else:
+        model = FakeChatModel(latency=0.0, tokens_per_sec=1e6, answer_tokens=args.num_predict,
+                              prompt_tokens_per_sec=args.prompt_tokens_per_sec)
+
+    rng = random.Random(0)
+    workdir = tempfile.mkdtemp(prefix="rag-packing-")
+    packer = ContextPacker(args.budget, args.duplicate_threshold)
+    agent = AnswerAgent(None, packer)
+    prompts = {"before": [], "after": []}
+    chunks = {"before": [], "after": []}
+    try:
+        data_dir = os.path.join(workdir, "data")
+        os.makedirs(data_dir)
+        write_corpus(data_dir, args.chunks, rng)
+        duplicate_documents(data_dir, args.duplicate_fraction, rng)
+        with contextlib.redirect_stdout(io.StringIO()):
+            engine = RAGEngine(data_dir, index_dir=os.path.join(workdir, "index"), encoder=HashingEncoder(),
+                               refresh_interval=0)
+
+        for i, query in enumerate(synthetic_queries(args.queries, rng)):
+            risk_level = RISK_LEVELS[i % len(RISK_LEVELS)]
+            docs = engine.search_many(expansions(query, rng), k=3)
+            vectors = engine.chunk_vectors([d["id"] for d in docs])
+            prompts["before"].append(legacy_prompt(query, docs, risk_level))
+            context = agent.pack_context(docs, vectors)
+            prompts["after"].append(agent.build_prompt(query, context, risk_level))
+            chunks["before"].append(len(docs))
+            chunks["after"].append(len(context))
+        engine.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"config": vars(args), "model": "ollama" if args.ollama else "fake", "results": {}}
+    for layout in ("before", "after"):
+        report["results"][layout] = {"context_chunks": round(float(np.mean(chunks[layout])), 2),
+                                     **run(model, prompts[layout], packer)}
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+End-to-end benchmark: index build, Orchestrator.process_query and the
+FastAPI /query and /upload endpoints, on synthetic corpora of increasing
+size, with the LLM replaced by a simulated Ollama (see fakes.py).
+
+Runs offline on a CPU-only machine. By default the embedding model is the
+HashingEncoder stand-in too; pass --encoder torch (or torch-int8, onnx,
+onnx-int8) to time the real model on that backend (its weights must
+already be downloaded).
+
+Usage (from backend/):
+    python -m benchmarks.e2e [--sizes 1000,5000,20000] [--concurrency 1,4,16]
+                             [--requests 64] [--latency 0.2] [--tokens-per-sec 50]
+                             [--output results.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+import rag_engine as rag_engine_module
+from benchmarks.fakes import FakeLLMClient, HashingEncoder
+from encoders import BACKENDS, SentenceTransformerEncoder
+
+WORDS = ("diabetes insulin glucose blood pressure heart kidney therapy dose patient "
+         "chronic risk treatment symptom diet exercise obesity cholesterol vitamin "
+         "infection vaccine fever asthma lung sleep stress hormone liver cancer "
+         "screening clinical trial study evidence guideline medication").split()
+
+
+def resident_kb() -> Dict[str, int]:
+    """Current resident memory (Linux /proc) and peak resident memory, in kB."""
+    usage = {"peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    usage["rss_kb"] = int(line.split()[1])
+    except OSError:
+        pass
+    return usage
+
+
+def percentiles(latencies: List[float]) -> Dict[str, float]:
+    ms = np.array(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+    }
+
+
+def synthetic_document(rng: random.Random, chars: int) -> str:
+    sentences = []
+    size = 0
+    while size < chars:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + ". "
+        sentences.append(sentence)
+        size += len(sentence)
+    return "".join(sentences)
+
+
+def write_corpus(data_dir: str, chunks: int, rng: random.Random, chunks_per_doc: int = 20):
+    """Writes text files adding up to roughly `chunks` 500-character chunks."""
+    for doc in range(max(1, chunks // chunks_per_doc)):
+        with open(os.path.join(data_dir, f"doc_{doc:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write(synthetic_document(rng, chunks_per_doc * 450))
+
+
+def synthetic_queries(count: int, rng: random.Random) -> List[str]:
+    return [f"what is the evidence on {' '.join(rng.sample(WORDS, 4))}" for _ in range(count)]
+
+
+async def run_concurrent(call, queries: List[str], concurrency: int) -> Dict:
+    """Issues `queries` with at most `concurrency` in flight; returns latency stats."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(query):
+        async with semaphore:
+            start = time.perf_counter()
+            await call(query)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(q) for q in queries))
+    wall = time.perf_counter() - start
+    return {"concurrency": concurrency, "requests": len(queries),
+            "throughput_rps": round(len(queries) / wall, 2), **percentiles(latencies)}
+
+
+async def bench_endpoints(main, queries: List[str], levels: List[int], uploads: int,
+                          rng: random.Random) -> Dict:
+    import httpx
+
+    results = {"query": [], "upload": None}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def query(text):
+            response = await client.post("/query", json={"text": text})
+            response.raise_for_status()
+
+        for concurrency in levels:
+            results["query"].append(await run_concurrent(query, queries, concurrency))
+
+        # Upload latency (until 202) and time until every ingestion job is done
+        accept, job_ids = [], []
+        start = time.perf_counter()
+        for i in range(uploads):
+            content = synthetic_document(rng, 20 * 450).encode("utf-8")
+            t = time.perf_counter()
+            response = await client.post("/upload", files={"file": (f"upload_{i:03d}.txt", content, "text/plain")})
+            response.raise_for_status()
+            accept.append(time.perf_counter() - t)
+            job_ids.append(response.json()["job_id"])
+
+        chunks = 0
+        for job_id in job_ids:
+            while True:
+                job = (await client.get(f"/jobs/{job_id}")).json()
+                if job["status"] in ("done", "failed"):
+                    chunks += job["chunks_embedded"]
+                    break
+                await asyncio.sleep(0.01)
+        wall = time.perf_counter() - start
+        results["upload"] = {"files": uploads, "chunks": chunks, "seconds_until_indexed": round(wall, 3),
+                             "chunks_per_sec": round(chunks / wall, 1), **percentiles(accept)}
+    return results
+
+
+async def bench_queries(args, engine, main_module, levels: List[int], rng: random.Random) -> Dict:
+    from context_packer import ContextPacker
+    from orchestrator import Orchestrator
+    from ingest_queue import IngestQueue
+    from safety import RiskLevel
+
+    llm = FakeLLMClient(args.latency, args.tokens_per_sec, args.answer_tokens, args.llm_concurrency)
+    orchestrator = Orchestrator(engine, llm, context_packer=ContextPacker())
+    queries = synthetic_queries(args.requests, rng)
+    results = {"orchestrator": [
+        await run_concurrent(lambda q: orchestrator.process_query(q, RiskLevel.MODERATE), queries, c)
+        for c in levels
+    ]}
+
+    if main_module is not None:
+        # Point the app's singletons at this corpus (its own warm-up never runs:
+        # the ASGI transport doesn't start the lifespan)
+        if main_module.ingest_queue is not None:
+            main_module.ingest_queue.stop()
+        main_module.rag_engine = engine
+        main_module.llm_client = llm
+        main_module.orchestrator = orchestrator
+        main_module.ingest_queue = IngestQueue(engine)
+        results["endpoints"] = await bench_endpoints(main_module, queries, levels, args.uploads, rng)
+        main_module.ingest_queue.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,5000,20000", help="Corpus sizes, in chunks")
+    parser.add_argument("--concurrency", default="1,4,16")
+    parser.add_argument("--requests", type=int, default=64, help="Queries per concurrency level")
+    parser.add_argument("--uploads", type=int, default=5, help="Files uploaded through /upload per size")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated LLM time to first token (s)")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0)
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--llm-concurrency", type=int, default=4)
+    parser.add_argument("--encoder", choices=("hash",) + BACKENDS, default="hash")
+    parser.add_argument("--encoder-batch-size", type=int, default=32)
+    parser.add_argument("--encoder-threads", type=int, default=0)
+    parser.add_argument("--index-factory", default="Flat")
+    parser.add_argument("--no-endpoints", action="store_true", help="Only benchmark the orchestrator")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    levels = [int(c) for c in args.concurrency.split(",")]
+    rng = random.Random(0)
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    if args.encoder == "hash":
+        encoder = HashingEncoder()
+    else:
+        encoder = SentenceTransformerEncoder(backend=args.encoder, batch_size=args.encoder_batch_size,
+                                             threads=args.encoder_threads)
+
+    report = {
+        "config": {**vars(args), "sizes": sizes, "concurrency": levels},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "results": [],
+    }
+    log = io.StringIO()  # The pipeline prints progress for every query
+    try:
+        with contextlib.redirect_stdout(log):
+            main_module = None
+            if not args.no_endpoints:
+                import main as main_module
+
+            for size in sizes:
+                data_dir = os.path.join(workdir, f"data_{size}")
+                index_dir = os.path.join(workdir, f"index_{size}")
+                os.makedirs(data_dir)
+                write_corpus(data_dir, size, rng)
+
+                memory_before = resident_kb()
+                start = time.perf_counter()
+                engine = rag_engine_module.RAGEngine(data_dir, index_dir=index_dir, index_factory=args.index_factory,
+                                                     encoder=encoder)
+                build_seconds = time.perf_counter() - start
+                start = time.perf_counter()
+                rag_engine_module.RAGEngine(data_dir, index_dir=index_dir, index_factory=args.index_factory,
+                                            encoder=encoder).close()
+                reload_seconds = time.perf_counter() - start
+                memory_after = resident_kb()
+
+                result = {
+                    "corpus_chunks": engine.index.ntotal,
+                    "corpus_files": len(engine.files),
+                    "index_build_seconds": round(build_seconds, 3),
+                    "index_reload_seconds": round(reload_seconds, 3),
+                    "memory": {"before_build": memory_before, "after_build": memory_after},
+                }
+                result.update(asyncio.run(bench_queries(args, engine, main_module, levels, rng)))
+                result["memory"]["after_queries"] = resident_kb()
+                # Release its mmaps and threads before the next corpus size is measured
+                engine.close()
+                report["results"].append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Parity and speed check of an embedding backend against the reference
+(full-precision PyTorch) encoder, on the documents in the data directory.
+
+Both encoders embed the same chunks and queries. For every query the exact
+top-k chunks under each encoder are compared: recall@k is the fraction of
+the reference top-k that the candidate also returns. The cosine similarity
+between the two encoders' vectors for the same chunk, and ingestion and
+single-query encoding speed, are reported too. Exits with status 1 when
+recall@k is below --min-recall.
+
+Queries are read from --queries (one per line) or, by default, taken from
+the opening words of randomly sampled chunks.
+
+Usage (from backend/):
+    python -m benchmarks.encoder_parity [--backend onnx-int8] [--reference torch]
+                                        [--data-dir ../data] [--k 10] [--queries queries.txt]
+                                        [--batch-size 32] [--threads 0] [--output parity.json]
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.e2e import percentiles
+from document_parser import ParallelParser
+from encoders import BACKENDS, SentenceTransformerEncoder
+
+
+def load_chunks(data_dir: str, limit: int, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str]:
+    """Chunks the documents in data_dir the way RAGEngine does."""
+    paths = sorted(p for p in glob.glob(os.path.join(data_dir, "**/*.*"), recursive=True)
+                   if p.endswith((".pdf", ".txt")))
+    chunks = []
+    for _, chunk in ParallelParser().iter_chunks(paths, chunk_size, chunk_overlap):
+        chunks.append(chunk)
+        if len(chunks) >= limit:
+            break
+    return chunks
+
+
+def timed_encode(encoder, texts: List[str]) -> Dict:
+    start = time.perf_counter()
+    vectors = encoder.encode(texts)
+    seconds = time.perf_counter() - start
+    return {"vectors": vectors, "seconds": seconds, "per_sec": len(texts) / seconds if seconds else 0.0}
+
+
+def query_latency(encoder, queries: List[str], samples: int = 50) -> Dict:
+    """Latency of embedding one query at a time, as at search time."""
+    latencies = []
+    for query in queries[:samples]:
+        start = time.perf_counter()
+        encoder.encode([query])
+        latencies.append(time.perf_counter() - start)
+    return percentiles(latencies)
+
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int) -> np.ndarray:
+    """Ids of the exact top-k chunks per query by inner product (unit vectors: cosine)."""
+    scores = queries @ corpus.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray) -> float:
+    k = reference.shape[1]
+    hits = [len(set(ref) & set(cand)) / k for ref, cand in zip(reference, candidate)]
+    return float(np.mean(hits))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=BACKENDS, default="onnx-int8")
+    parser.add_argument("--reference", choices=BACKENDS, default="torch")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--data-dir", default="../data")
+    parser.add_argument("--max-chunks", type=int, default=20000)
+    parser.add_argument("--queries", help="File with one query per line")
+    parser.add_argument("--num-queries", type=int, default=200, help="Queries sampled from chunks without --queries")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--quantization", help="ONNX int8 kernel set (avx2, avx512, avx512_vnni, arm64)")
+    parser.add_argument("--export-dir", default="../models")
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.data_dir, args.max_chunks)
+    if len(chunks) <= args.k:
+        sys.exit(f"Need more than {args.k} chunks in {args.data_dir}, found {len(chunks)}.")
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        rng = random.Random(0)
+        queries = [" ".join(chunk.split()[:12]) for chunk in rng.sample(chunks, min(args.num_queries, len(chunks)))]
+
+    report = {"config": vars(args), "chunks": len(chunks), "queries": len(queries), "encoders": {}}
+    results = {}
+    for role, backend in (("reference", args.reference), ("candidate", args.backend)):
+        start = time.perf_counter()
+        encoder = SentenceTransformerEncoder(args.model, backend=backend, batch_size=args.batch_size,
+                                             threads=args.threads, quantization=args.quantization,
+                                             export_dir=args.export_dir)
+        load_seconds = time.perf_counter() - start
+        encoder.encode(queries[:8])  # Warm-up
+        corpus = timed_encode(encoder, chunks)
+        results[role] = {"corpus": corpus["vectors"], "queries": encoder.encode(queries)}
+        report["encoders"][role] = {
+            "name": encoder.name,
+            "load_seconds": round(load_seconds, 3),
+            "chunks_per_sec": round(corpus["per_sec"], 1),
+            "query_latency": query_latency(encoder, queries),
+        }
+
+    reference, candidate = results["reference"], results["candidate"]
+    recall = recall_at_k(top_k(reference["queries"], reference["corpus"], args.k),
+                         top_k(candidate["queries"], candidate["corpus"], args.k))
+    cosines = np.sum(reference["corpus"] * candidate["corpus"], axis=1)
+    report["recall_at_k"] = round(recall, 4)
+    report["chunk_cosine"] = {"mean": round(float(cosines.mean()), 4), "min": round(float(cosines.min()), 4)}
+    report["ingest_speedup"] = round(report["encoders"]["candidate"]["chunks_per_sec"]
+                                     / report["encoders"]["reference"]["chunks_per_sec"], 2)
+    report["passed"] = recall >= args.min_recall
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(output)
+    if not report["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Offline stand-ins for the model dependencies, used by the benchmarks.
+
+FakeChatModel replaces the ChatOllama model inside LLMClient with a
+simulated one: each call waits `latency` seconds (prompt evaluation /
+time to first token) and then emits its reply at `tokens_per_sec`. With
+`prompt_tokens_per_sec` set, prompt evaluation time is proportional to the
+prompt tokens not already in a simulated prefix cache instead.
+HashingEncoder is an embedding backend computing a deterministic
+bag-of-words hash, so no model weights are needed.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import zlib
+from typing import List
+
+import numpy as np
+
+from encoders import Encoder
+from llm_client import LLMClient
+
+
+class FakeMessage:
+    def __init__(self, content: str, response_metadata: dict = None):
+        self.content = content
+        self.response_metadata = response_metadata or {}
+
+
+class FakeChatModel:
+    """Mimics the ChatOllama calls LLMClient makes (invoke, ainvoke, astream)."""
+
+    def __init__(self, latency: float = 0.2, tokens_per_sec: float = 50.0, answer_tokens: int = 120,
+                 prompt_tokens_per_sec: float = 0.0):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.answer_tokens = answer_tokens
+        # Like Ollama, the prefix shared with the previous prompt is served from
+        # the KV cache and only the rest is evaluated (0 = fixed `latency`)
+        self.prompt_tokens_per_sec = prompt_tokens_per_sec
+        self._last_prompt = ""
+        self.calls = 0
+
+    def _reply(self, messages) -> str:
+        system, user = messages[0].content, messages[-1].content
+        if "intent classifier" in system:
+            greeting = re.search(r"\b(hello|hi|thanks)\b", user.lower())
+            return json.dumps({"intent": "DIRECT_ANSWER" if greeting else "RAG_RESEARCH"})
+        if "search expert" in system:
+            words = re.findall(r"\w+", user.lower())
+            return json.dumps({"queries": [" ".join(words[:4]), " ".join(words[-4:])]})
+        words = " ".join(["evidence"] * self.answer_tokens)
+        return json.dumps({
+            "answer_summary": words[: len(words) // 4],
+            "detailed_explanation": words,
+            "confidence_score": "High",
+            "evidence_used": [],
+        })
+
+    def _tokens(self, text: str) -> List[str]:
+        # Roughly four characters per token, like Llama tokenizers on English text
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def _evaluate_prompt(self, messages) -> tuple:
+        """Returns (prompt tokens evaluated, seconds) and updates the prefix cache."""
+        prompt = "".join(m.content for m in messages)
+        if not self.prompt_tokens_per_sec:
+            return len(self._tokens(prompt)), self.latency
+        cached = len(os.path.commonprefix([prompt, self._last_prompt]))
+        self._last_prompt = prompt
+        evaluated = len(self._tokens(prompt)) - cached // 4
+        return evaluated, evaluated / self.prompt_tokens_per_sec
+
+    def _metadata(self, prompt: tuple, completion: str) -> dict:
+        """Token counts and durations (ns) in the shape Ollama reports them."""
+        eval_count = len(self._tokens(completion))
+        return {
+            "done": True,
+            "prompt_eval_count": prompt[0],
+            "prompt_eval_duration": int(prompt[1] * 1e9),
+            "eval_count": eval_count,
+            "eval_duration": int(eval_count / self.tokens_per_sec * 1e9),
+        }
+
+    def invoke(self, messages, **kwargs) -> FakeMessage:
+        self.calls += 1
+        text = self._reply(messages)
+        prompt = self._evaluate_prompt(messages)
+        time.sleep(prompt[1] + len(self._tokens(text)) / self.tokens_per_sec)
+        return FakeMessage(text, self._metadata(prompt, text))
+
+    async def ainvoke(self, messages, **kwargs) -> FakeMessage:
+        self.calls += 1
+        text = self._reply(messages)
+        prompt = self._evaluate_prompt(messages)
+        await asyncio.sleep(prompt[1] + len(self._tokens(text)) / self.tokens_per_sec)
+        return FakeMessage(text, self._metadata(prompt, text))
+
+    async def astream(self, messages, **kwargs):
+        self.calls += 1
+        text = self._reply(messages)
+        prompt = self._evaluate_prompt(messages)
+        await asyncio.sleep(prompt[1])
+        for token in self._tokens(text):
+            await asyncio.sleep(1.0 / self.tokens_per_sec)
+            yield FakeMessage(token)
+        yield FakeMessage("", self._metadata(prompt, text))
+
+
+class FakeLLMClient(LLMClient):
+    """LLMClient whose model is a FakeChatModel; everything else is the real client."""
+
+    def __init__(self, latency: float = 0.2, tokens_per_sec: float = 50.0,
+                 answer_tokens: int = 120, max_concurrency: int = 4):
+        super().__init__(max_concurrency=max_concurrency)
+        self.llm = FakeChatModel(latency, tokens_per_sec, answer_tokens)
+
+
+class HashingEncoder(Encoder):
+    """
+    Deterministic embedding model stand-in: hashes words into a fixed
+    number of buckets. Texts sharing words get similar vectors, which is all
+    retrieval needs for timing purposes.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                vectors[row, zlib.crc32(word.encode("utf-8")) % self.dim] += 1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
@@ -0,0 +1,77 @@
+"""
+Per-query cost of SafetyGuard's lexicon matching as the lexicon grows.
+
+Compares the compiled LexiconMatcher with the previous approach (a Python
+substring scan over every keyword) on synthetic lexicons and queries.
+
+Usage (from backend/):
+    python -m benchmarks.safety_matcher [--sizes 30,300,3000,30000] [--queries 2000]
+"""
+import argparse
+import random
+import string
+import time
+
+from safety import LexiconMatcher, RiskLevel, EMERGENCY_KEYWORDS, DIAGNOSTIC_KEYWORDS
+
+
+def synthetic_lexicon(size: int, rng: random.Random):
+    """Real keywords padded with random one- to three-word phrases."""
+    terms = set(t.rstrip("*") for t in EMERGENCY_KEYWORDS + DIAGNOSTIC_KEYWORDS)
+    while len(terms) < size:
+        words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+                 for _ in range(rng.randint(1, 3))]
+        terms.add(" ".join(words))
+    return sorted(terms)
+
+
+def synthetic_queries(count: int, lexicon, rng: random.Random):
+    filler = ("what are the common ways to manage blood sugar levels in older adults "
+              "with a family history of heart disease and high cholesterol").split()
+    queries = []
+    for i in range(count):
+        words = rng.sample(filler, 14)
+        if i % 3 == 0:  # a third of the queries contain a lexicon term
+            words.insert(rng.randrange(len(words)), rng.choice(lexicon))
+        queries.append(" ".join(words))
+    return queries
+
+
+def substring_scan(query: str, lexicon) -> bool:
+    query_lower = query.lower()
+    for kw in lexicon:
+        if kw in query_lower:
+            return True
+    return False
+
+
+def per_query_us(fn, queries) -> float:
+    start = time.perf_counter()
+    for query in queries:
+        fn(query)
+    return (time.perf_counter() - start) / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="30,300,3000,30000")
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'terms':>8} {'compile ms':>11} {'substring us/query':>19} {'compiled us/query':>18}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        lexicon = synthetic_lexicon(size, rng)
+        queries = synthetic_queries(args.queries, lexicon, rng)
+
+        start = time.perf_counter()
+        matcher = LexiconMatcher({RiskLevel.MODERATE: lexicon})
+        compile_ms = (time.perf_counter() - start) * 1e3
+
+        scan = per_query_us(lambda q: substring_scan(q, lexicon), queries)
+        compiled = per_query_us(matcher.find_all, queries)
+        print(f"{size:>8} {compile_ms:>11.1f} {scan:>19.1f} {compiled:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Time-to-listen and time-to-ready of the API server.
+
+Starts `uvicorn main:app` in a subprocess and polls it: time-to-listen is
+when the port first answers an HTTP request, time-to-ready when /readyz
+returns 200 (servers without /readyz count as ready once listening).
+The server's own per-stage startup breakdown from /readyz is included.
+
+Usage (from backend/):
+    python -m benchmarks.startup [--runs 3] [--port 8765] [--timeout 600] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def measure(port: int, timeout: float) -> dict:
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    result = {"seconds_to_listen": None, "seconds_to_ready": None, "server": None}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5.0) as client:
+            while time.perf_counter() - start < timeout:
+                if server.poll() is not None:
+                    raise RuntimeError(f"server exited with code {server.returncode}")
+                try:
+                    response = client.get("/readyz")
+                except httpx.TransportError:
+                    time.sleep(0.02)
+                    continue
+
+                elapsed = round(time.perf_counter() - start, 3)
+                if result["seconds_to_listen"] is None:
+                    result["seconds_to_listen"] = elapsed
+                if response.status_code == 200 or response.status_code == 404:
+                    result["seconds_to_ready"] = elapsed
+                    if response.status_code == 200:
+                        result["server"] = response.json()
+                    break
+                time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600.0)
+    parser.add_argument("--output", help="Write JSON results here instead of stdout")
+    args = parser.parse_args()
+
+    runs = [measure(args.port, args.timeout) for _ in range(args.runs)]
+    report = {"runs": runs}
+    for key in ("seconds_to_listen", "seconds_to_ready"):
+        values = sorted(r[key] for r in runs if r[key] is not None)
+        report[f"median_{key}"] = values[len(values) // 2] if values else None
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import json
+import os
+import sys
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+
+def _map(path: str, dtype: str, count: int) -> np.ndarray:
+    """Read-only memory map of the first `count` items of a file."""
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+class ChunkStore:
+    """
+    Columnar, read-only store of chunk texts and their sources.
+
+    Instead of one dict per chunk, all chunk texts are concatenated into one
+    UTF-8 blob, with an offsets array marking where each chunk starts and a
+    source-id array pointing into a small table of source names. The arrays
+    are memory-mapped from disk, so the corpus text lives in the page cache
+    and is shared by every worker process instead of being copied into each
+    heap; only the chunks that are actually read get decoded.
+
+    Files in `directory`:
+        chunks.bin         - concatenated UTF-8 chunk texts
+        chunk_offsets.i64  - int64 byte offsets, one per chunk plus the end
+        chunk_sources.i32  - int32 source id per chunk
+        sources.json       - list of source names, indexed by source id
+
+    The files only ever grow or get replaced wholesale, so a store opened
+    for `count` chunks stays valid while newer chunks are appended.
+    """
+    TEXT = "chunks.bin"
+    OFFSETS = "chunk_offsets.i64"
+    SOURCE_IDS = "chunk_sources.i32"
+    SOURCES = "sources.json"
+
+    def __init__(self, text: np.ndarray, offsets: np.ndarray, source_ids: np.ndarray, sources: List[str]):
+        self._text = text
+        self._offsets = offsets
+        self._source_ids = source_ids
+        self.sources = sources
+
+    @classmethod
+    def empty(cls) -> "ChunkStore":
+        return cls(np.zeros(0, dtype="uint8"), np.zeros(1, dtype="int64"), np.zeros(0, dtype="int32"), [])
+
+    @classmethod
+    def open(cls, directory: str, count: int) -> "ChunkStore":
+        """Maps the first `count` chunks stored in `directory`."""
+        path = lambda name: os.path.join(directory, name)
+        with open(path(cls.SOURCES), "r", encoding="utf-8") as f:
+            sources = json.load(f)
+        offsets = _map(path(cls.OFFSETS), "int64", count + 1)
+        text = _map(path(cls.TEXT), "uint8", int(offsets[-1]))
+        return cls(text, offsets, _map(path(cls.SOURCE_IDS), "int32", count), sources)
+
+    @classmethod
+    def check(cls, directory: str, count: int) -> bool:
+        """Whether the files in `directory` hold (at least) the first `count` chunks."""
+        path = lambda name: os.path.join(directory, name)
+        try:
+            if count < 0 or os.path.getsize(path(cls.OFFSETS)) < (count + 1) * 8:
+                return False
+            if os.path.getsize(path(cls.SOURCE_IDS)) < count * 4:
+                return False
+            end = np.fromfile(path(cls.OFFSETS), dtype="int64", count=1, offset=count * 8)
+            return int(end[0]) <= os.path.getsize(path(cls.TEXT))
+        except (OSError, IndexError):
+            return False
+
+    def __len__(self) -> int:
+        return len(self._source_ids)
+
+    def __getitem__(self, idx: int) -> Dict:
+        """Materializes one chunk as {"source", "content"}."""
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError("chunk index out of range")
+        return {"source": self.source(idx), "content": self.content(idx)}
+
+    def content(self, idx: int) -> str:
+        start, end = int(self._offsets[idx]), int(self._offsets[idx + 1])
+        return self._text[start:end].tobytes().decode("utf-8")
+
+    def source(self, idx: int) -> str:
+        return self.sources[int(self._source_ids[idx])]
+
+    def iter_range(self, start: int, count: int) -> Iterator[Tuple[str, str]]:
+        """Yields (source, content) for chunks start .. start + count - 1."""
+        for idx in range(start, start + count):
+            yield self.source(idx), self.content(idx)
+
+    @classmethod
+    def write(cls, directory: str, chunks: Iterable[Tuple[str, str]]) -> int:
+        """
+        Writes (source, content) pairs as a new store, replacing any existing
+        one. Chunks are streamed to disk, never held in memory all at once.
+        Returns the number of chunks written.
+        """
+        with ChunkWriter(directory) as writer:
+            writer.add(chunks)
+        return writer.count
+
+    def append(self, directory: str, chunks: List[Tuple[str, str]]) -> "ChunkStore":
+        """
+        Appends (source, content) pairs to the files this store was opened
+        from and returns a store covering the old and new chunks. This store
+        itself is left unchanged.
+        """
+        path = lambda name: os.path.join(directory, name)
+        sources = list(self.sources)
+        source_index = {source: i for i, source in enumerate(sources)}
+        data = [content.encode("utf-8") for _, content in chunks]
+        for source, _ in chunks:
+            if source not in source_index:
+                source_index[source] = len(sources)
+                sources.append(source)
+
+        offsets = int(self._offsets[-1]) + np.cumsum([len(d) for d in data], dtype="int64")
+        source_ids = np.array([source_index[source] for source, _ in chunks], dtype="int32")
+        # Drop anything past this store's end left behind by an interrupted write
+        # (this also creates the files, with a zero end offset, for an empty store)
+        for name, size in ((self.TEXT, int(self._offsets[-1])), (self.OFFSETS, (len(self) + 1) * 8),
+                           (self.SOURCE_IDS, len(self) * 4)):
+            with open(path(name), "ab") as f:
+                f.truncate(size)
+        with open(path(self.TEXT), "ab") as f:
+            f.write(b"".join(data))
+        with open(path(self.OFFSETS), "ab") as f:
+            f.write(offsets.tobytes())
+        with open(path(self.SOURCE_IDS), "ab") as f:
+            f.write(source_ids.tobytes())
+        self._write_sources(directory, sources)
+        return ChunkStore.open(directory, len(self) + len(chunks))
+
+    @classmethod
+    def _write_sources(cls, directory: str, sources: List[str]):
+        path = os.path.join(directory, cls.SOURCES)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(sources, f)
+        os.replace(path + ".tmp", path)
+
+
+class ChunkWriter:
+    """
+    Writes a new ChunkStore in `directory` incrementally: call add() as chunks
+    become available. The store replaces any existing one when the `with`
+    block exits without an error; otherwise the partial files are removed.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.count = 0
+        self._position = 0
+        self._sources, self._source_index = [], {}
+        self._files = {}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def __enter__(self) -> "ChunkWriter":
+        for name in (ChunkStore.TEXT, ChunkStore.OFFSETS, ChunkStore.SOURCE_IDS):
+            self._files[name] = open(self._path(name) + ".tmp", "wb")
+        self._files[ChunkStore.OFFSETS].write(np.int64(0).tobytes())
+        return self
+
+    def add(self, chunks: Iterable[Tuple[str, str]]):
+        text, offsets, source_ids = (self._files[name] for name in
+                                     (ChunkStore.TEXT, ChunkStore.OFFSETS, ChunkStore.SOURCE_IDS))
+        for source, content in chunks:
+            data = content.encode("utf-8")
+            text.write(data)
+            self._position += len(data)
+            offsets.write(np.int64(self._position).tobytes())
+            if source not in self._source_index:
+                self._source_index[source] = len(self._sources)
+                self._sources.append(source)
+            source_ids.write(np.int32(self._source_index[source]).tobytes())
+            self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        for f in self._files.values():
+            f.close()
+        names = list(self._files)
+        if exc_type is not None:
+            for name in names:
+                try:
+                    os.remove(self._path(name) + ".tmp")
+                except OSError:
+                    pass
+            return False
+        for name in names:
+            os.replace(self._path(name) + ".tmp", self._path(name))
+        ChunkStore._write_sources(self.directory, self._sources)
+        return False
+
+
+def _resident_kb() -> Dict[str, int]:
+    """Private (anonymous) and file-backed resident memory of this process, in kB."""
+    usage = {}
+    with open("/proc/self/status", "r") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon", "RssFile"):
+                usage[key] = int(value.split()[0])
+    return usage
+
+
+if __name__ == "__main__":
+    # Usage: python chunk_store.py [num_chunks] [directory]
+    # Compares the resident memory of a list of chunk dicts with a mapped
+    # ChunkStore over the same synthetic corpus (Linux only: reads /proc).
+    import gc
+    import random
+    import tempfile
+
+    num_chunks = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    directory = sys.argv[2] if len(sys.argv) > 2 else tempfile.mkdtemp()
+    words = ["insulin", "glucose", "patient", "therapy", "dose", "blood", "pressure",
+             "diabetes", "symptom", "treatment", "clinical", "risk", "study", "chronic"]
+
+    def synthetic_chunks():
+        rng = random.Random(0)
+        for i in range(num_chunks):
+            source = f"document_{i // 200:05d}.pdf"
+            yield source, " ".join(rng.choice(words) for _ in range(70))
+
+    ChunkStore.write(directory, synthetic_chunks())
+    gc.collect()
+    baseline = _resident_kb()
+
+    documents = [{"source": source, "content": content} for source, content in synthetic_chunks()]
+    as_dicts = _resident_kb()
+    del documents
+    gc.collect()
+
+    after_free = _resident_kb()
+    store = ChunkStore.open(directory, num_chunks)
+    sample = [store[i] for i in range(0, num_chunks, max(1, num_chunks // 1000))]
+    mapped = _resident_kb()
+    for _ in store.iter_range(0, len(store)):
+        pass
+    touched = _resident_kb()
+
+    print(json.dumps({
+        "chunks": num_chunks,
+        "text_bytes": os.path.getsize(os.path.join(directory, ChunkStore.TEXT)),
+        "list_of_dicts_private_kb": as_dicts["RssAnon"] - baseline["RssAnon"],
+        "chunk_store_private_kb": mapped["RssAnon"] - after_free["RssAnon"],
+        "chunk_store_shared_kb_after_full_scan": touched["RssFile"] - after_free["RssFile"],
+    }, indent=2))
@@ -0,0 +1,62 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class ContextPacker:
+    """
+    Chooses the retrieved chunks that go into the answer prompt. Chunks are
+    ranked by retrieval score; a chunk nearly identical to a higher-ranked one
+    (cosine similarity of their embeddings at or above `duplicate_threshold`,
+    or the same text when no embeddings are given) is dropped, and the rest
+    are added in rank order while they fit in `token_budget` (0 for no limit).
+
+    Token counts are estimated at `chars_per_token` characters per token,
+    which is close for Llama tokenizers on English text.
+    """
+
+    def __init__(self, token_budget: int = 1000, duplicate_threshold: float = 0.95,
+                 chars_per_token: float = 4.0):
+        self.token_budget = token_budget
+        self.duplicate_threshold = duplicate_threshold
+        self.chars_per_token = chars_per_token
+
+    def count_tokens(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1
+
+    @staticmethod
+    def format_chunk(chunk: Dict) -> str:
+        return f"Source ({chunk['source']}): {chunk['content']}"
+
+    def pack(self, chunks: List[Dict], vectors: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Returns the chunks to put in the prompt, best first. `vectors`, if
+        given, holds the embeddings of `chunks` row for row. The best chunk is
+        always kept, so a small budget never leaves the model without context.
+        """
+        order = sorted(range(len(chunks)), key=lambda i: chunks[i].get("score", 0), reverse=True)
+        if vectors is not None:
+            vectors = np.array(vectors, dtype="float32")
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.maximum(norms, 1e-12)
+
+        packed, kept, texts = [], [], set()
+        used = 0
+        for i in order:
+            chunk = chunks[i]
+            if vectors is not None:
+                if kept and float(np.max(vectors[kept] @ vectors[i])) >= self.duplicate_threshold:
+                    continue
+            else:
+                text = " ".join(chunk["content"].split())
+                if text in texts:
+                    continue
+                texts.add(text)
+
+            tokens = self.count_tokens(self.format_chunk(chunk))
+            if packed and self.token_budget and used + tokens > self.token_budget:
+                continue  # A shorter, lower-ranked chunk may still fit
+            packed.append(chunk)
+            kept.append(i)
+            used += tokens
+        return packed
@@ -0,0 +1,231 @@
+import bisect
+import functools
+import multiprocessing
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import pypdf
+
+
+def count_pages(file_path: str) -> int:
+    """Number of pages of a PDF (text files count as a single page)."""
+    if not file_path.endswith('.pdf'):
+        return 1
+    return len(pypdf.PdfReader(file_path).pages)
+
+
+def extract_pages(file_path: str, start: int, end: int) -> List[str]:
+    """
+    Returns the text of pages [start, end) of a file. Runs in worker processes,
+    so it only takes and returns plain picklable values.
+    """
+    try:
+        if not file_path.endswith('.pdf'):
+            with open(file_path, "r", encoding="utf-8") as f:
+                return [f.read()]
+        reader = pypdf.PdfReader(file_path)
+        return [(reader.pages[i].extract_text() or "") + "\n" for i in range(start, end)]
+    except Exception as e:
+        print(f"Error reading {file_path} (pages {start}-{end}): {e}")
+        return []
+
+
+@functools.lru_cache(maxsize=None)
+def _offset_splitter_class():
+    # Imported here so spawned parser workers, which only extract text, start quickly
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    class OffsetSplitter(RecursiveCharacterTextSplitter):
+        """
+        RecursiveCharacterTextSplitter that also reports where in the text each
+        chunk begins. The splits it merges are consecutive slices of the text, so
+        offsets are added up as they are consumed rather than searched for, which
+        goes wrong in repetitive text.
+        """
+
+        def split_text(self, text: str) -> List[str]:
+            self._offset = 0
+            self._starts = []
+            return super().split_text(text)
+
+        def split_with_offsets(self, text: str) -> List[Tuple[int, str]]:
+            """(offset of the chunk's first split, chunk) pairs, in order."""
+            chunks = self.split_text(text)
+            return list(zip(self._starts, chunks))
+
+        def _merge_splits(self, splits, separator: str) -> List[str]:
+            # TextSplitter._merge_splits, keeping the offset of every split
+            separator_len = self._length_function(separator)
+            docs = []
+            current_doc = []
+            total = 0
+
+            def emit():
+                doc = self._join_docs([d for _, d in current_doc], separator)
+                if doc is not None:
+                    docs.append(doc)
+                    self._starts.append(current_doc[0][0])
+
+            for d in splits:
+                len_ = self._length_function(d)
+                if total + len_ + (separator_len if current_doc else 0) > self._chunk_size and current_doc:
+                    emit()
+                    while total > self._chunk_overlap or (
+                            total + len_ + (separator_len if current_doc else 0) > self._chunk_size and total > 0):
+                        total -= self._length_function(current_doc[0][1]) + (separator_len if len(current_doc) > 1 else 0)
+                        current_doc = current_doc[1:]
+                current_doc.append((self._offset, d))
+                self._offset += len(d) + len(separator)
+                total += len_ + (separator_len if len(current_doc) > 1 else 0)
+            if current_doc:
+                emit()
+            return docs
+
+    return OffsetSplitter
+
+
+class StreamingSplitter:
+    """
+    Chunks text that arrives piece by piece (e.g. page by page) without holding
+    the whole document. Text is buffered until it spans `window` chunks and split
+    up to its last separator; chunks are emitted up to the start of the
+    paragraph, line or word (whichever the buffer is split on) in which the last
+    chunk begins, and the text from there on is carried over. The splitter
+    starts that piece afresh when splitting the whole document too. When the
+    carried text lies inside a paragraph or line longer than a chunk, that one
+    is split on its own once it ends, as the splitter does, so the chunks come
+    out the same as splitting the whole document.
+    """
+
+    # RecursiveCharacterTextSplitter's default separators, coarsest first
+    SEPARATORS = ("\n\n", "\n", " ")
+
+    def __init__(self, chunk_size: int, chunk_overlap: int, window: int = 8):
+        self._splitter = _offset_splitter_class()(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self._window = chunk_size * window
+        self._parts = []
+        self._size = 0
+        # Separator the carried text was cut at, inside longer pieces of the coarser ones
+        self._level = None
+
+    def _close_pieces(self, buffer: str) -> Tuple[List[str], str]:
+        """Splits off the rest of the long pieces the carried text lies in, once they end."""
+        chunks = []
+        while self._level:
+            ends = [(buffer.find(sep), level) for level, sep in enumerate(self.SEPARATORS[:self._level])
+                    if sep in buffer]
+            if not ends:
+                break
+            end, self._level = min(ends)
+            chunks.extend(self._splitter.split_text(buffer[:end]))
+            buffer = buffer[end:]
+        return chunks, buffer
+
+    def feed(self, text: str) -> List[str]:
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size < self._window:
+            return []
+
+        chunks, buffer = self._close_pieces("".join(self._parts))
+        level = next((level for level, sep in enumerate(self.SEPARATORS) if sep in buffer), None)
+        if level is not None:
+            # Pieces keep the separator in front of them, as the splitter cuts them
+            starts = [m.start() for m in re.finditer(re.escape(self.SEPARATORS[level]), buffer)]
+            # The splitter must not see a piece cut off by the end of the buffer
+            split = self._splitter.split_with_offsets(buffer[:starts[-1]])
+            if len(split) >= 2:
+                last = split[-1][0]
+                tail_start = starts[bisect.bisect_right(starts, last) - 1] if starts[0] <= last else 0
+                emitted = [chunk for start, chunk in split if start < tail_start]
+                if emitted:
+                    chunks.extend(emitted)
+                    buffer = buffer[tail_start:]
+                    self._level = level
+
+        self._parts = [buffer]
+        self._size = len(buffer)
+        return chunks
+
+    def flush(self) -> List[str]:
+        chunks, buffer = self._close_pieces("".join(self._parts))
+        chunks.extend(self._splitter.split_text(buffer))
+        self._parts = []
+        self._size = 0
+        self._level = None
+        return chunks
+
+
+class ParallelParser:
+    """
+    Extracts document text on a process pool. Large PDFs are split into page
+    ranges of `pages_per_task` so a single document also uses every core.
+    Results come back in document/page order, and at most `max_inflight`
+    tasks are outstanding so parsed text never piles up ahead of the consumer.
+    """
+
+    def __init__(self, workers: Optional[int] = None, pages_per_task: int = 16,
+                 max_inflight: Optional[int] = None, min_parallel_pages: int = 64):
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = pages_per_task
+        self.max_inflight = max_inflight or self.workers * 2
+        # Below this many pages, starting worker processes costs more than it saves
+        self.min_parallel_pages = min_parallel_pages
+
+    def _tasks(self, file_paths: List[str]) -> Iterator[Tuple[str, int, int]]:
+        for file_path in file_paths:
+            try:
+                pages = count_pages(file_path)
+            except Exception as e:
+                print(f"Error reading {file_path}: {e}")
+                continue
+            for start in range(0, pages, self.pages_per_task):
+                yield file_path, start, min(start + self.pages_per_task, pages)
+
+    def iter_pages(self, file_paths: List[str]) -> Iterator[Tuple[str, List[str]]]:
+        """Yields (file_path, page_texts) for consecutive page ranges of each file."""
+        tasks = list(self._tasks(file_paths))
+        total_pages = sum(end - start for _, start, end in tasks)
+        if self.workers <= 1 or len(tasks) <= 1 or total_pages < self.min_parallel_pages:
+            for task in tasks:
+                yield task[0], extract_pages(*task)
+            return
+
+        # "spawn" rather than fork: the parent runs torch and server threads,
+        # which are not fork-safe
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks)), mp_context=context) as pool:
+            inflight = deque()
+            for task in tasks:
+                inflight.append((task[0], pool.submit(extract_pages, *task)))
+                if len(inflight) >= self.max_inflight:
+                    file_path, future = inflight.popleft()
+                    yield file_path, future.result()
+            while inflight:
+                file_path, future = inflight.popleft()
+                yield file_path, future.result()
+
+    def iter_chunks(self, file_paths: List[str], chunk_size: int, chunk_overlap: int,
+                    progress: Optional[dict] = None) -> Iterator[Tuple[str, str]]:
+        """
+        Yields (file_path, chunk) in document order while pages are still being
+        parsed. `progress["pages_parsed"]` is updated as pages arrive.
+        """
+        current, splitter = None, None
+        for file_path, pages in self.iter_pages(file_paths):
+            if file_path != current:
+                if splitter:
+                    for chunk in splitter.flush():
+                        yield current, chunk
+                current, splitter = file_path, StreamingSplitter(chunk_size, chunk_overlap)
+            for page in pages:
+                if progress is not None and file_path.endswith('.pdf'):
+                    progress["pages_parsed"] = progress.get("pages_parsed", 0) + 1
+                for chunk in splitter.feed(page):
+                    yield file_path, chunk
+        if splitter:
+            for chunk in splitter.flush():
+                yield current, chunk
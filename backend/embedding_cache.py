@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Content-addressed cache of chunk embeddings.
+
+    Entries are keyed by a hash of the model name and the chunk text, so the
+    same text is only ever embedded once per model, whichever file it came from.
+    Vectors live in a fixed-size memory-mapped array on disk; once it is full
+    the least recently used slot is reused.
+
+    The files may be shared by several processes (e.g. uvicorn workers on one
+    index_dir). Lookups read them without locking, checking each slot's key
+    before and after reading its vector. New embeddings are kept in memory
+    until flush(), the only method that writes, which must be called with
+    IndexStore.writer_lock() held.
+
+    Layout of `cache_dir`:
+        vectors.bin    - (max_entries, dim) array of `dtype`
+        slot_keys.bin  - key stored in each slot, checked on every hit
+        keys.json      - cache settings + keys in LRU order with their slot
+    """
+    VECTORS = "vectors.bin"
+    SLOT_KEYS = "slot_keys.bin"
+    KEYS = "keys.json"
+
+    def __init__(self, cache_dir: str, model_name: str, dim: int,
+                 max_entries: int = 100_000, dtype: str = "float32"):
+        if dtype not in ("float32", "float16"):
+            raise ValueError(f"Unsupported embedding cache dtype: {dtype}")
+
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.dim = dim
+        self.max_entries = max_entries
+        self.dtype = dtype
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._slots = OrderedDict()  # key -> slot, least recently used first
+        self._pending = OrderedDict()  # key -> embedding, not written to disk yet
+        self._touched = set()  # Keys hit since the last flush
+        self._keys_stat = None  # keys.json as last read or written by this process
+        self._dirty = False
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        self._open()
+
+    def _settings(self) -> Dict:
+        return {"dim": self.dim, "max_entries": self.max_entries, "dtype": self.dtype}
+
+    def _open(self):
+        """Opens the on-disk cache, starting empty if it is missing or incompatible."""
+        vectors_path = os.path.join(self.cache_dir, self.VECTORS)
+        slot_keys_path = os.path.join(self.cache_dir, self.SLOT_KEYS)
+        keys_path = os.path.join(self.cache_dir, self.KEYS)
+        shape = (self.max_entries, self.dim)
+
+        try:
+            with open(keys_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            if stored.get("settings") != self._settings():
+                raise ValueError("embedding cache settings changed")
+            self.vectors = np.memmap(vectors_path, dtype=self.dtype, mode="r+", shape=shape)
+            self.slot_keys = np.memmap(slot_keys_path, dtype="S64", mode="r+", shape=(self.max_entries,))
+            self._slots = OrderedDict(stored["entries"])
+            self._next_slot = stored["next_slot"]
+            self._keys_stat = self._stat(keys_path)
+        except (OSError, ValueError, KeyError, json.JSONDecodeError):
+            self.vectors = np.memmap(vectors_path, dtype=self.dtype, mode="w+", shape=shape)
+            self.slot_keys = np.memmap(slot_keys_path, dtype="S64", mode="w+", shape=(self.max_entries,))
+            self._slots = OrderedDict()
+            self._next_slot = 0
+            self._dirty = True
+
+    @staticmethod
+    def _stat(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _reload(self):
+        """Adopts the key table another process wrote since this one last read or wrote it."""
+        keys_path = os.path.join(self.cache_dir, self.KEYS)
+        st = self._stat(keys_path)
+        if st is None or st == self._keys_stat:
+            return
+        try:
+            with open(keys_path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        if stored.get("settings") != self._settings():
+            return
+        self._slots = OrderedDict(stored["entries"])
+        self._next_slot = stored["next_slot"]
+        self._keys_stat = st
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def encode(self, texts: List[str], encode_fn: Callable) -> np.ndarray:
+        """
+        Returns float32 embeddings for `texts`, calling `encode_fn` only for
+        texts that are not cached yet (each distinct text at most once).
+        """
+        keys = [self.key(text) for text in texts]
+        out = np.empty((len(texts), self.dim), dtype="float32")
+
+        with self._lock:
+            missing = self._lookup(keys, range(len(keys)), out)
+            if missing:
+                # Another process may have added them since the key table was read
+                self._reload()
+                missing = self._lookup(keys, [i for positions in missing.values() for i in positions], out)
+            self.misses += sum(len(positions) for positions in missing.values())
+
+        if not missing:
+            return out
+
+        # Encode outside the lock so lookups from other threads are not blocked
+        missing_keys = list(missing)
+        embeddings = np.asarray(
+            encode_fn([texts[missing[key][0]] for key in missing_keys]), dtype="float32"
+        )
+
+        with self._lock:
+            for key, embedding in zip(missing_keys, embeddings):
+                out[missing[key]] = embedding
+                self._pending[key] = embedding
+        return out
+
+    def _lookup(self, keys: List[str], positions: Iterable[int], out: np.ndarray) -> Dict[str, List[int]]:
+        """Fills `out` at the `positions` of cached keys; returns the others as key -> positions."""
+        missing = {}
+        for i in positions:
+            key = keys[i]
+            pending = self._pending.get(key)
+            if pending is not None:
+                out[i] = pending
+                self.hits += 1
+                continue
+            slot = self._slots.get(key)
+            vector = self._read(slot, key) if slot is not None else None
+            if vector is None:
+                if slot is not None:
+                    del self._slots[key]  # Slot reused since the key table was read
+                missing.setdefault(key, []).append(i)
+                continue
+            self._slots.move_to_end(key)
+            self._touched.add(key)
+            out[i] = vector
+            self.hits += 1
+        return missing
+
+    def _read(self, slot: int, key: str):
+        """The vector cached in `slot` for `key`, or None if the slot holds (or is being given) another key."""
+        stored_key = key.encode("ascii")
+        if self.slot_keys[slot] != stored_key:
+            return None
+        vector = np.array(self.vectors[slot], dtype="float32")
+        # Another process may have reused the slot while it was being read
+        return vector if self.slot_keys[slot] == stored_key else None
+
+    def pending(self) -> int:
+        """Number of embeddings waiting for flush()."""
+        return len(self._pending)
+
+    def _store(self, key: str, embedding: np.ndarray):
+        slot = self._slots.get(key)
+        if slot is None:
+            if self._next_slot < self.max_entries:
+                slot = self._next_slot
+                self._next_slot += 1
+            else:
+                _, slot = self._slots.popitem(last=False)  # Evict least recently used
+        self._slots[key] = slot
+        self._slots.move_to_end(key)
+        # Invalidate the slot first, so readers never pair its key with a half-written vector
+        self.slot_keys[slot] = b""
+        self.vectors[slot] = embedding
+        self.slot_keys[slot] = key.encode("ascii")
+
+    def flush(self, min_pending: int = 0):
+        """
+        Writes the pending embeddings to the vector file and persists the key
+        table, if at least `min_pending` embeddings are pending. Must be called
+        with IndexStore.writer_lock() held.
+        """
+        with self._lock:
+            if len(self._pending) < min_pending:
+                return
+            if not (self._pending or self._touched or self._dirty):
+                return
+            self._reload()
+            for key in self._touched:
+                if key in self._slots:
+                    self._slots.move_to_end(key)
+            for key, embedding in self._pending.items():
+                self._store(key, embedding)
+            self._pending.clear()
+            self._touched.clear()
+
+            self.vectors.flush()
+            self.slot_keys.flush()
+            keys_path = os.path.join(self.cache_dir, self.KEYS)
+            with open(keys_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({
+                    "settings": self._settings(),
+                    "next_slot": self._next_slot,
+                    "entries": list(self._slots.items()),
+                }, f)
+            os.replace(keys_path + ".tmp", keys_path)
+            self._keys_stat = self._stat(keys_path)
+            self._dirty = False
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._slots) + len(self._pending),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,115 @@
+import os
+import platform
+from typing import List, Optional
+
+import numpy as np
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+class Encoder:
+    """
+    Text embedding interface used by RAGEngine (and by the intent router and
+    answer cache through it). It mirrors the two SentenceTransformer methods
+    the pipeline calls.
+
+    `name` identifies the vectors an encoder produces: stored snapshots and
+    embedding cache entries are only reused by an encoder with the same name.
+    """
+    name = "encoder"
+
+    def get_sentence_embedding_dimension(self) -> int:
+        raise NotImplementedError
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        """Embeds texts into a (len(texts), dim) float32 array of unit vectors."""
+        raise NotImplementedError
+
+
+def default_quantization() -> str:
+    """ONNX Runtime int8 kernel set for this CPU."""
+    return "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+
+
+class SentenceTransformerEncoder(Encoder):
+    """
+    SentenceTransformer model on one of several CPU backends:
+
+        torch       - full-precision PyTorch (reference)
+        torch-int8  - PyTorch with Linear layers dynamically quantized to int8
+        onnx        - ONNX Runtime export of the model
+        onnx-int8   - ONNX Runtime export with dynamic int8 quantization
+
+    The ONNX backends need sentence-transformers >= 3.2 with
+    optimum[onnxruntime]. The exported (and quantized) model is written to
+    `export_dir` once and loaded from there afterwards.
+
+    `batch_size` is the number of texts per forward pass; `threads` caps the
+    intra-op threads of the backend (0 leaves the library default, usually
+    one per core).
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", backend: str = "torch",
+                 batch_size: int = 32, threads: int = 0, quantization: Optional[str] = None,
+                 export_dir: str = "../models"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown embedding backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+        self.model_name = model_name
+        self.backend = backend
+        self.batch_size = batch_size
+        self.threads = threads
+        self.quantization = quantization or default_quantization()
+        self.name = model_name if backend == "torch" else f"{model_name}:{backend}"
+        if backend == "onnx-int8":
+            self.name += f":{self.quantization}"
+
+        if backend.startswith("onnx"):
+            self.model = self._load_onnx(export_dir)
+        else:
+            self.model = self._load_torch()
+
+    def _load_torch(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        model = SentenceTransformer(self.model_name, device="cpu")
+        if self.backend == "torch-int8":
+            # Weights stored as int8, activations quantized on the fly per batch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _load_onnx(self, export_dir: str):
+        import onnxruntime
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        path = os.path.join(export_dir, self.model_name.replace("/", "__") + "-onnx")
+        file_name = "onnx/model.onnx"
+        if self.backend == "onnx-int8":
+            file_name = f"onnx/model_qint8_{self.quantization}.onnx"
+
+        if not os.path.exists(os.path.join(path, file_name)):
+            print(f"Exporting {self.model_name} to ONNX ({self.backend}) in {path}...")
+            model = SentenceTransformer(self.model_name, device="cpu", backend="onnx")
+            model.save_pretrained(path)
+            if self.backend == "onnx-int8":
+                export_dynamic_quantized_onnx_model(model, self.quantization, path)
+
+        options = onnxruntime.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        return SentenceTransformer(path, device="cpu", backend="onnx", model_kwargs={
+            "file_name": file_name,
+            "provider": "CPUExecutionProvider",
+            "session_options": options,
+        })
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        kwargs.setdefault("batch_size", self.batch_size)
+        kwargs.setdefault("normalize_embeddings", True)
+        vectors = self.model.encode(list(texts), convert_to_numpy=True, show_progress_bar=False, **kwargs)
+        return np.asarray(vectors, dtype="float32")
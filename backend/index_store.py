@@ -0,0 +1,396 @@
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from chunk_store import ChunkStore, ChunkWriter
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+SNAPSHOT_FORMAT = 3
+
+
+def file_digest(file_path: str, block_size: int = 1 << 20) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _replace_atomically(path: str, write):
+    """Writes via a temporary file and renames it over `path`."""
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_index(path: str, mmap: bool):
+    """
+    Reads a FAISS index. With `mmap`, the index data is mapped read-only from
+    the file (shared between processes through the page cache) where the index
+    type supports it; such an index must not be modified or cloned.
+    """
+    if mmap and hasattr(faiss, "IO_FLAG_MMAP"):
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass  # Index type can't be mapped
+    return faiss.read_index(path)
+
+
+class IndexStore:
+    """
+    Versioned on-disk snapshots of the FAISS index, the chunk texts and a
+    manifest of the files (with content hashes) that produced them.
+
+    Every change is written as a new version and published by atomically
+    replacing the CURRENT pointer. A published version is never modified, so
+    any number of processes can read it while a writer prepares the next.
+    Chunk texts and embeddings live in append-only data segments shared by
+    consecutive versions: a version records how many chunks of its segment it
+    covers, so appending chunks for the next version doesn't disturb readers of
+    the previous one. A full rebuild starts a new segment.
+
+    Each file entry in a manifest records the ids of its chunks (`start`,
+    `count`): chunk ids are positions in the segment and stay the same for as
+    long as the segment does. Deleting or replacing a file tombstones its ids
+    (the manifest's `deleted` ranges) instead of rewriting the segment or the
+    index; a compaction rebuild into a new segment drops them for good.
+
+    Layout of `index_dir`:
+        CURRENT               - name of the published version
+        versions/<version>/
+            manifest.json     - snapshot config, segment, chunk count, per-file entries,
+                                tombstoned chunk id ranges
+            index.faiss       - serialized FAISS index
+        segments/<segment>/
+            chunks.bin, chunk_offsets.i64, chunk_sources.i32, sources.json
+                              - chunk texts and sources in index order (see ChunkStore)
+            vectors.f32       - raw float32 embeddings, in index order (kept so the
+                                index can be rebuilt or retrained without re-encoding)
+        writer.lock           - held by the process writing a new version
+
+    Methods that write (save, append, publish_deletions) must be called with
+    writer_lock() held.
+    """
+    CURRENT = "CURRENT"
+    VERSIONS = "versions"
+    SEGMENTS = "segments"
+    LOCK = "writer.lock"
+    MANIFEST = "manifest.json"
+    VECTORS = "vectors.f32"
+    INDEX = "index.faiss"
+    # Snapshot files of the previous, unversioned layout
+    LEGACY_FILES = (MANIFEST, VECTORS, INDEX, ChunkStore.TEXT, ChunkStore.OFFSETS,
+                    ChunkStore.SOURCE_IDS, ChunkStore.SOURCES)
+
+    def __init__(self, index_dir: str, keep_versions: int = 3):
+        self.index_dir = index_dir
+        self.keep_versions = keep_versions  # Published versions kept for readers that lag behind
+        for name in (self.VERSIONS, self.SEGMENTS):
+            os.makedirs(self._path(name), exist_ok=True)
+
+    def _path(self, *names: str) -> str:
+        return os.path.join(self.index_dir, *names)
+
+    @contextmanager
+    def writer_lock(self):
+        """Exclusive lock across processes sharing `index_dir` (e.g. uvicorn workers)."""
+        with open(self._path(self.LOCK), "a+b") as f:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        pass  # LK_LOCK gives up after 10 seconds
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                else:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def current_version(self) -> Optional[str]:
+        """Name of the published version, or None if nothing was published yet."""
+        try:
+            with open(self._path(self.CURRENT), "r", encoding="utf-8") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def load(self, config: Dict, index_config: Optional[Dict], version: Optional[str] = None,
+             mmap: bool = True) -> Optional[Dict]:
+        """
+        Loads a version (the published one by default): its manifest, the
+        memory-mapped chunk store and the index, memory-mapped too with `mmap`.
+        Returns None unless the version was built with the same `config` and is
+        internally consistent.
+        If `index_config` is given and differs from the stored one, the stored
+        vectors are still usable, so the snapshot is returned with "index" set
+        to None. A flat index standing in for an index type that could not be
+        trained yet (marked "fallback") counts as that type.
+        """
+        version = version or self.current_version()
+        if version is None:
+            return None
+        try:
+            with open(self._path(self.VERSIONS, version, self.MANIFEST), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("config") != config:
+            print("Index snapshot is missing or was built with a different configuration.")
+            return None
+
+        ntotal = manifest.get("ntotal", -1)
+        segment_dir = self._path(self.SEGMENTS, manifest.get("segment", ""))
+        if not ChunkStore.check(segment_dir, ntotal):
+            print(f"Index version {version} is inconsistent, ignoring it.")
+            return None
+
+        try:
+            documents = ChunkStore.open(segment_dir, ntotal)
+            index = _read_index(self._path(self.VERSIONS, version, self.INDEX), mmap)
+            vector_bytes = os.path.getsize(os.path.join(segment_dir, self.VECTORS))
+        except (OSError, RuntimeError, ValueError, json.JSONDecodeError) as e:
+            print(f"Failed to read index version {version}: {e}")
+            return None
+
+        if index.ntotal != ntotal or vector_bytes < ntotal * config["dim"] * 4:
+            print(f"Index version {version} is inconsistent, ignoring it.")
+            return None
+
+        stored_config = {key: value for key, value in manifest.get("index_config", {}).items() if key != "fallback"}
+        if index_config is not None and stored_config != index_config:
+            print("Index type changed, rebuilding it from the stored vectors.")
+            index = None
+
+        files = manifest["files"]
+        offset = 0
+        for entry in files:
+            entry.setdefault("start", offset)  # Written before entries had ids: contiguous
+            offset = entry["start"] + entry["count"]
+        return {"version": version, "segment": manifest["segment"], "files": files,
+                "deleted": manifest.get("deleted", []), "index_config": manifest["index_config"],
+                "documents": documents, "index": index}
+
+    def read_index(self, version: str):
+        """A private, writable copy of a version's FAISS index."""
+        return _read_index(self._path(self.VERSIONS, version, self.INDEX), mmap=False)
+
+    def replace_index(self, version: str, index_config: Dict, index):
+        """
+        Swaps a rebuilt FAISS index (e.g. of another type) into a version whose
+        chunks are unchanged, instead of publishing a new version. Processes
+        that have the old index mapped keep reading it. Call with the writer
+        lock held.
+        """
+        version_dir = self._path(self.VERSIONS, version)
+        # The index goes first: after a crash in between, the manifest still
+        # names the old type and the index is simply rebuilt again
+        _replace_atomically(os.path.join(version_dir, self.INDEX), lambda path: faiss.write_index(index, path))
+        manifest_path = os.path.join(version_dir, self.MANIFEST)
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        manifest["index_config"] = index_config
+
+        def write_manifest(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+
+        _replace_atomically(manifest_path, write_manifest)
+
+    def load_vectors(self, segment: str, dim: int, count: int) -> np.ndarray:
+        """Memory-maps the first `count` stored embeddings of a segment as a (count, dim) array."""
+        if count == 0:
+            return np.zeros((0, dim), dtype="float32")
+        return np.memmap(self._path(self.SEGMENTS, segment, self.VECTORS), dtype="float32",
+                         mode="r", shape=(count, dim))
+
+    def save(self, config: Dict, index_config: Dict, files: List[Dict],
+             chunks: Iterable[Tuple[str, str]], index, vectors: np.ndarray) -> str:
+        """
+        Writes a complete snapshot into a new segment and publishes it as a new
+        version. `chunks` yields (source, content) pairs in index order; the
+        `start` of each file entry must match it. Returns the version name.
+        """
+        with self.new_segment() as segment:
+            segment.add(chunks, vectors)
+        return self.publish_segment(config, index_config, files, segment, index)
+
+    def new_segment(self) -> "SegmentWriter":
+        """
+        Starts a segment for the next version, to be filled incrementally and
+        then published with publish_segment. Call with the writer lock held.
+        """
+        name = self._next_version()
+        directory = self._path(self.SEGMENTS, name)
+        os.makedirs(directory, exist_ok=True)
+        return SegmentWriter(directory, name)
+
+    def publish_segment(self, config: Dict, index_config: Dict, files: List[Dict],
+                        segment: "SegmentWriter", index) -> str:
+        """Publishes a segment written with new_segment, and `index` over it, as a new version."""
+        self._publish(segment.name, config, index_config, files, segment.name, segment.count, [], index)
+        return segment.name
+
+    def append(self, config: Dict, index_config: Dict, files: List[Dict], deleted: List[List[int]],
+               base_version: str, segment: str, documents: ChunkStore, new_chunks: List[Tuple[str, str]],
+               index, new_vectors: np.ndarray) -> str:
+        """
+        Appends freshly added chunks and embeddings behind `documents` (the chunk
+        store of the published version `base_version`, in `segment`) and publishes
+        them, with `index`, as a new version. Returns the version name.
+        """
+        self._check_base(base_version)
+
+        segment_dir = self._path(self.SEGMENTS, segment)
+        vectors_path = os.path.join(segment_dir, self.VECTORS)
+        new_vectors = np.ascontiguousarray(new_vectors, dtype="float32")
+        with open(vectors_path, "ab") as f:
+            # Drop anything left behind by an interrupted write
+            f.truncate(len(documents) * new_vectors.shape[1] * 4)
+            f.write(new_vectors.tobytes())
+        documents.append(segment_dir, new_chunks)
+
+        version = self._next_version()
+        self._publish(version, config, index_config, files, segment, len(documents) + len(new_chunks),
+                      deleted, index)
+        return version
+
+    def publish_deletions(self, config: Dict, index_config: Dict, files: List[Dict], deleted: List[List[int]],
+                          base_version: str, segment: str, ntotal: int) -> str:
+        """
+        Publishes a new version of `base_version` with more tombstones and no
+        new chunks (files removed, or replaced by ones without text). Its segment
+        and index are unchanged, so nothing is rewritten but the manifest (the
+        index file is hard-linked where possible).
+        """
+        self._check_base(base_version)
+        version = self._next_version()
+        version_dir = self._path(self.VERSIONS, version)
+        os.makedirs(version_dir, exist_ok=True)
+        base_index = self._path(self.VERSIONS, base_version, self.INDEX)
+        try:
+            os.link(base_index, os.path.join(version_dir, self.INDEX))
+        except OSError:
+            shutil.copyfile(base_index, os.path.join(version_dir, self.INDEX))
+        self._publish(version, config, index_config, files, segment, ntotal, deleted, None)
+        return version
+
+    def _check_base(self, base_version: str):
+        if base_version != self.current_version():
+            raise RuntimeError(f"Index version {base_version} is no longer the published one")
+
+    def _next_version(self) -> str:
+        versions = [int(name) for name in os.listdir(self._path(self.VERSIONS)) if name.isdigit()]
+        return f"{max(versions, default=0) + 1:08d}"
+
+    def _publish(self, version: str, config: Dict, index_config: Dict, files: List[Dict],
+                 segment: str, ntotal: int, deleted: List[List[int]], index):
+        """Writes the version's index (unless `index` is None: already in place) and manifest, then publishes it."""
+        version_dir = self._path(self.VERSIONS, version)
+        os.makedirs(version_dir, exist_ok=True)
+        if index is not None:
+            faiss.write_index(index, os.path.join(version_dir, self.INDEX))
+        with open(os.path.join(version_dir, self.MANIFEST), "w", encoding="utf-8") as f:
+            json.dump({
+                "format": SNAPSHOT_FORMAT,
+                "config": config,
+                "index_config": index_config,
+                "segment": segment,
+                "ntotal": ntotal,
+                "deleted": deleted,
+                "files": files,
+            }, f, indent=2)
+
+        # The pointer moves last, so it only ever names a complete version
+        def write_pointer(path):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(version)
+
+        _replace_atomically(self._path(self.CURRENT), write_pointer)
+        self._collect_garbage()
+
+    def _collect_garbage(self):
+        """
+        Deletes all but the newest `keep_versions` versions, and segments no kept
+        version uses. Processes still holding a deleted version keep reading it
+        through their open mappings (POSIX); where files in use can't be deleted,
+        they are retried on the next publish.
+        """
+        versions = sorted((name for name in os.listdir(self._path(self.VERSIONS)) if name.isdigit()),
+                          reverse=True)
+        segments_in_use = set()
+        for name in versions[:self.keep_versions]:
+            try:
+                with open(self._path(self.VERSIONS, name, self.MANIFEST), "r", encoding="utf-8") as f:
+                    segments_in_use.add(json.load(f)["segment"])
+            except (OSError, json.JSONDecodeError, KeyError):
+                pass
+        for name in versions[self.keep_versions:]:
+            shutil.rmtree(self._path(self.VERSIONS, name), ignore_errors=True)
+        if not segments_in_use:
+            return  # Keep the data if the kept manifests could not be read
+        for name in os.listdir(self._path(self.SEGMENTS)):
+            if name not in segments_in_use:
+                shutil.rmtree(self._path(self.SEGMENTS, name), ignore_errors=True)
+        for name in self.LEGACY_FILES:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+
+
+class SegmentWriter:
+    """
+    Streams chunks and their embeddings into a new segment, so that building
+    a snapshot never needs the whole corpus in memory. The segment is complete
+    once the `with` block exits; its vectors can then be memory-mapped with
+    IndexStore.load_vectors to build the index.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.name = name
+        self._chunks = ChunkWriter(directory)
+        self._vectors = None
+
+    @property
+    def count(self) -> int:
+        return self._chunks.count
+
+    def __enter__(self) -> "SegmentWriter":
+        self._chunks.__enter__()
+        self._vectors = open(os.path.join(self.directory, IndexStore.VECTORS), "wb")
+        return self
+
+    def add(self, chunks: Iterable[Tuple[str, str]], vectors: np.ndarray):
+        """Appends (source, content) pairs and their embeddings, row for row."""
+        start = self._chunks.count
+        self._chunks.add(chunks)
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if len(vectors) != self._chunks.count - start:
+            raise ValueError(f"{self._chunks.count - start} chunks but {len(vectors)} vectors")
+        self._vectors.write(vectors.tobytes())
+
+    def __exit__(self, exc_type, exc, tb):
+        self._vectors.close()
+        return self._chunks.__exit__(exc_type, exc, tb)
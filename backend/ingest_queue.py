@@ -0,0 +1,93 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from rag_engine import RAGEngine
+
+
+class IngestJob:
+    """One queued ingestion request covering one or more uploaded files."""
+
+    def __init__(self, file_paths: List[str]):
+        self.id = uuid.uuid4().hex
+        self.file_paths = file_paths
+        self.status = "queued"  # queued -> running -> done | failed
+        self.message = None
+        self.progress = {"pages_parsed": 0, "chunks_total": 0, "chunks_embedded": 0}
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "files": len(self.file_paths),
+            "message": self.message,
+            **self.progress,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestQueue:
+    """
+    Runs document ingestion on a background worker thread so uploads return
+    immediately. Jobs are processed in submission order; each job's files are
+    encoded together and published to the live index in one step by
+    RAGEngine.add_documents. The most recent `max_jobs` jobs are kept for
+    status queries.
+    """
+
+    def __init__(self, rag_engine: RAGEngine, max_jobs: int = 1000):
+        self.rag = rag_engine
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()  # id -> IngestJob, oldest first
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+        self._worker.start()
+
+    def submit(self, file_paths: List[str]) -> IngestJob:
+        job = IngestJob(file_paths)
+        with self._lock:
+            self.jobs[job.id] = job
+            # Forget the oldest finished jobs beyond the history limit
+            for job_id in list(self.jobs):
+                if len(self.jobs) <= self.max_jobs:
+                    break
+                if self.jobs[job_id].finished_at is not None:
+                    del self.jobs[job_id]
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Stops the worker after the jobs already queued have finished."""
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+
+            job.status = "running"
+            try:
+                success, message = self.rag.add_documents(job.file_paths, job.progress)
+                job.status = "done" if success else "failed"
+                job.message = message
+            except Exception as e:
+                print(f"Ingestion Error: {e}")
+                job.status = "failed"
+                job.message = str(e)
+            job.finished_at = time.time()
@@ -0,0 +1,146 @@
+import json
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# Labeled prototype queries per intent. Greetings, compliments and identity
+# questions are answered directly; anything medical goes through retrieval.
+DEFAULT_PROTOTYPES = {
+    "DIRECT_ANSWER": [
+        # Greetings / small talk
+        "hi", "hello", "hey there", "good morning", "good evening",
+        "how are you?", "thanks", "thank you so much", "bye", "see you later",
+        "you are great", "nice job, that was helpful",
+        # Identity
+        "who are you?", "what are you?", "what is your name?",
+        "what can you do?", "are you a doctor?", "who made you?",
+    ],
+    "RAG_RESEARCH": [
+        "what are the symptoms of type 2 diabetes?",
+        "how is high blood pressure treated?",
+        "what causes migraines?",
+        "is it safe to take ibuprofen with paracetamol?",
+        "how long does the flu last?",
+        "what is a normal blood sugar level?",
+        "what are the side effects of metformin?",
+        "how can I lower my cholesterol?",
+        "what is the difference between a cold and the flu?",
+        "how does insulin work?",
+        "what are the risk factors for heart disease?",
+        "how much sleep does an adult need?",
+    ],
+}
+
+
+def load_prototypes(path: str) -> Dict[str, List[str]]:
+    """Loads prototypes from a JSON file shaped like {"INTENT": ["example", ...]}."""
+    with open(path, "r", encoding="utf-8") as f:
+        prototypes = json.load(f)
+    if not isinstance(prototypes, dict) or not all(isinstance(v, list) and v for v in prototypes.values()):
+        raise ValueError(f"Invalid prototype file: {path}")
+    return prototypes
+
+
+def load_labeled(path: str) -> List[Tuple[str, str]]:
+    """Loads a labeled evaluation set: one {"text": ..., "intent": ...} object per line."""
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                samples.append((row["text"], row["intent"]))
+    return samples
+
+
+class IntentRouter:
+    """
+    Local intent classifier built on the retrieval encoder.
+
+    The query embedding is compared against every prototype embedding in one
+    matrix product; each intent scores its best-matching prototype. When the
+    winner does not beat the runner-up by `margin` (or matches nothing well),
+    `classify` returns None so the caller can fall back to the LLM router.
+    """
+
+    def __init__(self, encoder, prototypes: Optional[Dict[str, List[str]]] = None,
+                 margin: float = 0.05, min_similarity: float = 0.3):
+        self.encoder = encoder
+        self.margin = margin
+        self.min_similarity = min_similarity
+        self.set_prototypes(prototypes or DEFAULT_PROTOTYPES)
+
+    def set_prototypes(self, prototypes: Dict[str, List[str]]):
+        """Encodes the prototypes, grouped by intent so per-intent maxima are one reduceat."""
+        self.labels = list(prototypes)
+        examples = [example for label in self.labels for example in prototypes[label]]
+        sizes = [len(prototypes[label]) for label in self.labels]
+        self._group_starts = np.cumsum([0] + sizes[:-1])
+        self._prototypes = self._embed(examples)
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.encoder.encode(texts), dtype="float32")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def _label_scores(self, query_vectors: np.ndarray) -> np.ndarray:
+        """(n_queries, n_labels) matrix of best cosine similarity per intent."""
+        similarities = query_vectors @ self._prototypes.T
+        return np.maximum.reduceat(similarities, self._group_starts, axis=1)
+
+    def _decide(self, scores: np.ndarray) -> Optional[str]:
+        order = np.argsort(scores)[::-1]
+        best = scores[order[0]]
+        runner_up = scores[order[1]] if len(order) > 1 else -1.0
+        if best < self.min_similarity or best - runner_up < self.margin:
+            return None
+        return self.labels[order[0]]
+
+    def classify(self, query: str) -> Optional[str]:
+        """Returns the intent label, or None if the decision is ambiguous."""
+        return self._decide(self._label_scores(self._embed([query]))[0])
+
+    def classify_vector(self, query_vector: np.ndarray) -> Optional[str]:
+        """classify for a query the caller has already embedded with the same encoder."""
+        vector = np.asarray(query_vector, dtype="float32")
+        vector = vector / max(float(np.linalg.norm(vector)), 1e-12)
+        return self._decide(self._label_scores(vector[None, :])[0])
+
+    def evaluate(self, samples: List[Tuple[str, str]]) -> Dict:
+        """
+        Reports routing quality on (text, intent) pairs. Ambiguous queries count
+        towards `fallback_rate` and are excluded from `accuracy`.
+        """
+        if not samples:
+            return {"samples": 0}
+
+        start = time.perf_counter()
+        scores = self._label_scores(self._embed([text for text, _ in samples]))
+        elapsed = time.perf_counter() - start
+
+        decided = correct = 0
+        for row, (_, expected) in zip(scores, samples):
+            intent = self._decide(row)
+            if intent is None:
+                continue
+            decided += 1
+            correct += intent == expected
+
+        return {
+            "samples": len(samples),
+            "accuracy": round(correct / decided, 3) if decided else 0.0,
+            "fallback_rate": round(1 - decided / len(samples), 3),
+            "ms_per_query": round(elapsed * 1000 / len(samples), 3),
+        }
+
+
+if __name__ == "__main__":
+    # Usage: python intent_router.py labeled.jsonl [prototypes.json]
+    from sentence_transformers import SentenceTransformer
+
+    labeled = load_labeled(sys.argv[1])
+    prototypes = load_prototypes(sys.argv[2]) if len(sys.argv) > 2 else None
+    router = IntentRouter(SentenceTransformer("all-MiniLM-L6-v2"), prototypes)
+    print(json.dumps(router.evaluate(labeled), indent=2))
@@ -1,38 +1,470 @@
 from langchain_ollama import ChatOllama
 from langchain_core.messages import SystemMessage, HumanMessage
+import asyncio
+import contextlib
+import copy
+import hashlib
 import json
 import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from ollama import ResponseError
+
+from telemetry import LLM_EVENTS, LLM_QUEUE_WAIT_SECONDS, REGISTRY, record_llm_call
+
+# Ollama answers 429/503 when its request queue is full; 5xx are usually transient too
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class JSONFieldStream:
+    """
+    Incrementally extracts the values of top-level string fields from a JSON
+    object that arrives in arbitrary pieces, e.g. "answer_summary" while the
+    model is still generating it.
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = set(fields)
+        self._depth = 0
+        self._in_string = False
+        self._escape = None      # Pending escape sequence inside a string
+        self._is_key = False     # Current string is a top-level key
+        self._key_chars = []
+        self._last_key = None
+        self._expect_value = False
+        self._field = None       # Field whose value is being streamed
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        """Consumes the next piece of text and returns new (field, text) fragments."""
+        fragments = []
+        for ch in text:
+            if self._in_string:
+                if self._escape is not None:
+                    self._escape += ch
+                    if self._escape[1] == "u" and len(self._escape) < 6:
+                        continue
+                    try:
+                        ch = json.loads(f'"{self._escape}"')
+                    except json.JSONDecodeError:
+                        ch = ""
+                    self._escape = None
+                elif ch == "\\":
+                    self._escape = ch
+                    continue
+                elif ch == '"':
+                    self._in_string = False
+                    if self._is_key:
+                        self._last_key = "".join(self._key_chars)
+                    self._field = None
+                    continue
+
+                if self._is_key:
+                    self._key_chars.append(ch)
+                elif self._field:
+                    if fragments and fragments[-1][0] == self._field:
+                        fragments[-1] = (self._field, fragments[-1][1] + ch)
+                    else:
+                        fragments.append((self._field, ch))
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                top_level = self._depth == 1
+                self._is_key = top_level and not self._expect_value
+                if self._is_key:
+                    self._key_chars = []
+                elif top_level and self._last_key in self.fields:
+                    self._field = self._last_key
+                self._expect_value = False
+            elif ch in "{[":
+                self._depth += 1
+                self._expect_value = False
+            elif ch in "}]":
+                self._depth -= 1
+            elif ch == ":" and self._depth == 1:
+                self._expect_value = True
+            elif ch == "," and self._depth == 1:
+                self._expect_value = False
+        return fragments
+
+
+class _SlotWaiter:
+    __slots__ = ("granted", "wake")
+
+    def __init__(self, wake):
+        self.granted = False
+        self.wake = wake
+
+
+class SlotLimiter:
+    """
+    Counting semaphore shared by threads and event loops, so blocking and
+    async callers draw from the same `slots`. Waiters are served in arrival
+    order; a released slot is handed straight to the next one.
+    """
+
+    def __init__(self, slots: int):
+        self._lock = threading.Lock()
+        self._free = slots
+        self._waiters = deque()
+
+    def _try_acquire(self, wake) -> Optional[_SlotWaiter]:
+        """Takes a free slot (returns None) or queues a waiter (returns it)."""
+        with self._lock:
+            if self._free and not self._waiters:
+                self._free -= 1
+                return None
+            waiter = _SlotWaiter(wake)
+            self._waiters.append(waiter)
+            return waiter
+
+    def _give_up(self, waiter: _SlotWaiter) -> bool:
+        """Dequeues a waiter that stopped waiting; True if it had been granted a slot meanwhile."""
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+            return waiter.granted
+
+    def acquire(self, timeout: float) -> bool:
+        """Blocks for up to `timeout` seconds; True if a slot was acquired."""
+        event = threading.Event()
+        waiter = self._try_acquire(event.set)
+        if waiter is None:
+            return True
+        event.wait(timeout)
+        return self._give_up(waiter)
+
+    async def acquire_async(self, timeout: float):
+        """Waits for up to `timeout` seconds without blocking the event loop; raises TimeoutError otherwise."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = self._try_acquire(lambda: loop.call_soon_threadsafe(self._wake, future))
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            if self._give_up(waiter):
+                self.release()
+            raise
+
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._free += 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+        try:
+            waiter.wake()
+        except RuntimeError:  # Its event loop is closed
+            self.release()
+
 
 class LLMClient:
-    def __init__(self, model_name="llama3.1"):
-        self.llm = ChatOllama(model=model_name, temperature=0.2, format="json")
-    
+    """
+    Calls Ollama through a shared ChatOllama whose HTTP clients keep a pool of
+    keep-alive connections sized to `max_concurrency`, the number of
+    generations allowed in flight (set it to the server's OLLAMA_NUM_PARALLEL
+    so excess requests queue here rather than inside Ollama).
+
+    Every call has a deadline of `timeout` seconds, queueing included, and
+    transient failures (connection errors, 429/5xx) are retried up to
+    `max_retries` times with exponential backoff while the deadline allows.
+    Identical prompts issued while one is already being generated share that
+    generation instead of starting another (streaming calls excepted).
+    """
+
+    def __init__(self, model_name="llama3.1", max_concurrency: int = 4, timeout: float = 120.0,
+                 connect_timeout: float = 5.0, max_retries: int = 2, retry_backoff: float = 0.5,
+                 base_url: Optional[str] = None):
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        client_kwargs = {
+            "timeout": httpx.Timeout(timeout, connect=connect_timeout),
+            "limits": httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency,
+                                   keepalive_expiry=300.0),
+        }
+        self.llm = ChatOllama(model=model_name, temperature=0.2, format="json", base_url=base_url,
+                              client_kwargs=client_kwargs)
+        # Caps in-flight generations, blocking and async calls together,
+        # so bursts queue here instead of at Ollama
+        self._slots = SlotLimiter(max_concurrency)
+        # Identical in-flight requests: prompt key -> [task, waiters] (async) or Future (sync)
+        self._inflight = {}
+        self._sync_inflight = {}
+        self._sync_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._counts = {"calls": 0, "coalesced": 0, "retries": 0, "timeouts": 0, "errors": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._waits = 0
+
     def invoke_agent(self, system_prompt: str, user_message: str) -> dict:
         """
         Generic method to invoke the LLM with a specific system prompt.
         Expects JSON output from the LLM.
         """
+        key = self._key(system_prompt, user_message)
+        with self._sync_lock:
+            shared = self._sync_inflight.get(key)
+            if shared is None:
+                future = self._sync_inflight[key] = Future()
+        if shared is not None:
+            self._count("coalesced")
+            return copy.deepcopy(shared.result())
+
         try:
-            response = self.llm.invoke([
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_message)
-            ])
-            
-            content = response.content
+            result = self._generate(system_prompt, user_message)
+            future.set_result(result)
+            return copy.deepcopy(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._sync_lock:
+                self._sync_inflight.pop(key, None)
+
+    async def ainvoke_agent(self, system_prompt: str, user_message: str) -> dict:
+        """
+        Async counterpart of invoke_agent. Uses the non-blocking chat API so the
+        event loop keeps serving other requests while the model generates.
+        """
+        key = self._key(system_prompt, user_message)
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.create_task(self._agenerate(system_prompt, user_message))
+            entry = self._inflight[key] = [task, 0]
+            task.add_done_callback(lambda _: self._inflight.pop(key) if self._inflight.get(key) is entry else None)
+        else:
+            self._count("coalesced")
+
+        # The generation runs as its own task so one caller being cancelled
+        # doesn't cancel it for the others; it is dropped once nobody waits
+        entry[1] += 1
+        try:
+            result = await asyncio.shield(entry[0])
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not entry[0].done():
+                entry[0].cancel()
+            raise
+        finally:
+            entry[1] -= 1
+        return copy.deepcopy(result)
+
+    async def astream_agent(self, system_prompt: str, user_message: str,
+                            fields: Iterable[str]) -> AsyncIterator[dict]:
+        """
+        Streams a JSON-producing generation. Yields {"type": "token", "field", "text"}
+        for each new fragment of the requested string fields as the model emits it,
+        then a final {"type": "result", "data": <parsed JSON>}.
+        A failed attempt is only retried if it had not produced any output yet.
+        """
+        deadline = time.monotonic() + self.timeout
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            parser = JSONFieldStream(fields)
+            content = []
+            try:
+                async with self._slot(deadline):
+                    start = time.perf_counter()
+                    metadata = {}
+                    stream = self.llm.astream(self._messages(system_prompt, user_message)).__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(stream.__anext__(), self._remaining(deadline))
+                        except StopAsyncIteration:
+                            break
+                        content.append(chunk.content)
+                        # Ollama reports token counts and durations on the final chunk
+                        if getattr(chunk, "response_metadata", None):
+                            metadata.update(chunk.response_metadata)
+                        for field, text in parser.feed(chunk.content):
+                            yield {"type": "token", "field": field, "text": text}
+                    record_llm_call(metadata, time.perf_counter() - start)
+                data = self._parse_json("".join(content))
+
+            except Exception as e:
+                if not content and self._should_retry(e, attempt, deadline):
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                data = self._failed(e)
+
+            yield {"type": "result", "data": data}
+            return
+
+    def stats(self) -> Dict:
+        """Queue depth, in-flight generations, waiting times and retry/coalescing counts."""
+        with self._stats_lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._running,
+                "queue_depth": self._queued,
+                **self._counts,
+                "wait_ms_avg": round(self._wait_total / self._waits * 1000, 2) if self._waits else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 2),
+            }
+
+    def _generate(self, system_prompt: str, user_message: str) -> dict:
+        deadline = time.monotonic() + self.timeout
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._sync_slot(deadline):
+                    start = time.perf_counter()
+                    response = self.llm.invoke(self._messages(system_prompt, user_message))
+                    record_llm_call(getattr(response, "response_metadata", {}), time.perf_counter() - start)
+                return self._parse_json(response.content)
+
+            except Exception as e:
+                if self._should_retry(e, attempt, deadline):
+                    time.sleep(self._backoff(attempt))
+                    continue
+                return self._failed(e)
+
+    async def _agenerate(self, system_prompt: str, user_message: str) -> dict:
+        deadline = time.monotonic() + self.timeout
+        self._count("calls")
+        for attempt in range(self.max_retries + 1):
             try:
-                # Find JSON substring if permissible
-                json_match = re.search(r'\{.*\}', content, re.DOTALL)
-                if json_match:
-                    data = json.loads(json_match.group(0))
-                else:
-                    data = json.loads(content)
-                return data
-            except json.JSONDecodeError:
-                return {"error": "Failed to parse JSON", "raw_content": content}
-                
-        except Exception as e:
-            print(f"LLM Error: {e}")
-            return {"error": str(e)}
+                async with self._slot(deadline):
+                    start = time.perf_counter()
+                    response = await asyncio.wait_for(
+                        self.llm.ainvoke(self._messages(system_prompt, user_message)), self._remaining(deadline))
+                    record_llm_call(getattr(response, "response_metadata", {}), time.perf_counter() - start)
+                return self._parse_json(response.content)
+
+            except Exception as e:
+                if self._should_retry(e, attempt, deadline):
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                return self._failed(e)
+
+    @contextlib.asynccontextmanager
+    async def _slot(self, deadline: float):
+        """Waits (until the deadline at most) for one of the in-flight generation slots."""
+        self._enter_queue()
+        start = time.perf_counter()
+        try:
+            await self._slots.acquire_async(self._remaining(deadline))
+        except BaseException:
+            self._leave_queue(time.perf_counter() - start, acquired=False)
+            raise
+        self._leave_queue(time.perf_counter() - start, acquired=True)
+        try:
+            yield
+        finally:
+            self._slots.release()
+            self._finish()
+
+    @contextlib.contextmanager
+    def _sync_slot(self, deadline: float):
+        self._enter_queue()
+        start = time.perf_counter()
+        acquired = self._slots.acquire(max(deadline - time.monotonic(), 0.0))
+        self._leave_queue(time.perf_counter() - start, acquired)
+        if not acquired:
+            raise TimeoutError("timed out waiting for a free LLM slot")
+        try:
+            yield
+        finally:
+            self._slots.release()
+            self._finish()
+
+    def _enter_queue(self):
+        with self._stats_lock:
+            self._queued += 1
+
+    def _leave_queue(self, waited: float, acquired: bool):
+        with self._stats_lock:
+            self._queued -= 1
+            if not acquired:
+                return
+            self._running += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._waits += 1
+        if REGISTRY.enabled:
+            LLM_QUEUE_WAIT_SECONDS.observe(waited)
+
+    def _finish(self):
+        with self._stats_lock:
+            self._running -= 1
+
+    def _count(self, event: str):
+        with self._stats_lock:
+            self._counts[event] += 1
+        if REGISTRY.enabled and event != "calls":
+            LLM_EVENTS.inc(event=event)
+
+    @staticmethod
+    def _remaining(deadline: float) -> float:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        return remaining
+
+    def _backoff(self, attempt: int) -> float:
+        return self.retry_backoff * (2 ** attempt)
+
+    def _should_retry(self, error: Exception, attempt: int, deadline: float) -> bool:
+        retryable = isinstance(error, (httpx.TransportError, ConnectionError)) or (
+            isinstance(error, ResponseError) and error.status_code in RETRYABLE_STATUS)
+        if not retryable or attempt >= self.max_retries:
+            return False
+        if time.monotonic() + self._backoff(attempt) >= deadline:
+            return False
+        print(f"LLM call failed ({error!r}), retrying (attempt {attempt + 2}/{self.max_retries + 1})...")
+        self._count("retries")
+        return True
+
+    def _failed(self, error: Exception) -> dict:
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError, httpx.TimeoutException)):
+            self._count("timeouts")
+            error = f"LLM call exceeded its {self.timeout:g}s deadline"
+        else:
+            self._count("errors")
+        print(f"LLM Error: {error}")
+        return {"error": str(error)}
+
+    @staticmethod
+    def _key(system_prompt: str, user_message: str) -> str:
+        return hashlib.sha256(f"{system_prompt}\0{user_message}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _messages(system_prompt: str, user_message: str) -> list:
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_message)
+        ]
+
+    @staticmethod
+    def _parse_json(content: str) -> dict:
+        try:
+            # Find JSON substring if permissible
+            json_match = re.search(r'\{.*\}', content, re.DOTALL)
+            if json_match:
+                data = json.loads(json_match.group(0))
+            else:
+                data = json.loads(content)
+            return data
+        except json.JSONDecodeError:
+            return {"error": "Failed to parse JSON", "raw_content": content}
 
     def generate_response(self, query: str, context_chunks: list) -> dict:
         """
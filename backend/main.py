@@ -1,23 +1,148 @@
+import time
+_import_started = time.perf_counter()  # Reference point for time-to-listen and time-to-ready
+
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import Depends, FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
+import json
 import os
 import shutil
-from rag_engine import RAGEngine
+import threading
 from safety import SafetyGuard
-from llm_client import LLMClient
+import telemetry
+
+# Set environment variable to disable progress bars
+os.environ["HF_HUB_DISABLE_PROGRESS_BARS"] = "1"
 
-from orchestrator import Orchestrator
+# Metrics and tracing; with METRICS_ENABLED=0 spans are no-ops
+telemetry.REGISTRY.enabled = os.getenv("METRICS_ENABLED", "1") == "1"
 
-# Initialize Singletons
-rag_engine = RAGEngine()
-llm_client = LLMClient()
-orchestrator = Orchestrator(rag_engine, llm_client)
+if os.getenv("SAFETY_EMERGENCY_LEXICON") or os.getenv("SAFETY_DIAGNOSTIC_LEXICON"):
+    SafetyGuard.load_lexicons(os.getenv("SAFETY_EMERGENCY_LEXICON"), os.getenv("SAFETY_DIAGNOSTIC_LEXICON"))
+
+# Singletons, created by warm_up() in the background after the server starts listening.
+# The heavy modules (torch via sentence_transformers, faiss, langchain) are only
+# imported there, so importing this module and binding the port is fast.
+rag_engine = None
+llm_client = None
+answer_cache = None
+orchestrator = None
+ingest_queue = None
+
+# Startup progress reported by /readyz
+startup = {"state": "starting", "error": None, "seconds_to_listen": None, "seconds_to_ready": None, "stages": {}}
+
+def warm_up():
+    """
+    Imports the model stack, loads the encoder and the index, and runs one
+    search so the first real query doesn't pay for lazy initialization.
+    The singletons are published only once all of them are usable.
+    """
+    global rag_engine, llm_client, answer_cache, orchestrator, ingest_queue
+    stages = startup["stages"]
+    try:
+        stage_start = time.perf_counter()
+        from rag_engine import RAGEngine
+        from encoders import SentenceTransformerEncoder
+        from llm_client import LLMClient
+        from orchestrator import Orchestrator
+        from answer_cache import SemanticAnswerCache
+        from context_packer import ContextPacker
+        from ingest_queue import IngestQueue
+        stages["imports"] = round(time.perf_counter() - stage_start, 3)
+
+        stage_start = time.perf_counter()
+        # Embedding backend: torch (reference), torch-int8, onnx or onnx-int8
+        encoder = SentenceTransformerEncoder(
+            backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+            batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+            threads=int(os.getenv("EMBEDDING_THREADS", "0")),
+            quantization=os.getenv("EMBEDDING_QUANTIZATION"),
+            export_dir=os.getenv("EMBEDDING_EXPORT_DIR", "../models"),
+        )
+        # Per-stage concurrency limits: parallel vector searches and in-flight LLM generations
+        engine = RAGEngine(
+            data_dir=os.getenv("DATA_DIR", "../data"),
+            index_dir=os.getenv("INDEX_DIR", "../index"),
+            search_workers=int(os.getenv("SEARCH_WORKERS", "4")),
+            index_factory=os.getenv("INDEX_FACTORY", "Flat"),
+            nprobe=int(os.getenv("INDEX_NPROBE", "16")),
+            ef_search=int(os.getenv("INDEX_EF_SEARCH", "64")),
+            refresh_interval=float(os.getenv("INDEX_REFRESH_SECONDS", "2")),
+            compact_ratio=float(os.getenv("INDEX_COMPACT_RATIO", "0.2")),
+            parse_workers=int(os.getenv("PARSE_WORKERS", "0")) or None,
+            encoder=encoder,
+        )
+        stages["model_and_index"] = round(time.perf_counter() - stage_start, 3)
+
+        stage_start = time.perf_counter()
+        engine.search("warm up", k=1)
+        stages["encoder_warmup"] = round(time.perf_counter() - stage_start, 3)
+
+        # Match LLM_MAX_CONCURRENCY to the Ollama server's OLLAMA_NUM_PARALLEL
+        client = LLMClient(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", os.getenv("OLLAMA_NUM_PARALLEL", "4"))),
+            timeout=float(os.getenv("LLM_TIMEOUT", "120")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            base_url=os.getenv("OLLAMA_HOST"),
+        )
+        cache = None
+        if os.getenv("ANSWER_CACHE", "1") == "1":
+            cache = SemanticAnswerCache(
+                threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+                max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1000")),
+                ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+                persist_path=os.getenv("ANSWER_CACHE_PATH"),
+                save_interval=float(os.getenv("ANSWER_CACHE_SAVE_SECONDS", "10")),
+            )
+        rag_engine, llm_client, answer_cache = engine, client, cache
+        ingest_queue = IngestQueue(engine)
+        orchestrator = Orchestrator(engine, client,
+                                    speculative=os.getenv("SPECULATIVE_ROUTING", "0") == "1",
+                                    local_routing=os.getenv("LOCAL_ROUTING", "0") == "1",
+                                    prototypes_path=os.getenv("INTENT_PROTOTYPES"),
+                                    answer_cache=cache,
+                                    context_packer=ContextPacker(
+                                        token_budget=int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000")),
+                                        duplicate_threshold=float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", "0.95")),
+                                    ))
+
+        startup["state"] = "ready"
+        startup["seconds_to_ready"] = round(time.perf_counter() - _import_started, 3)
+        print(f"Ready in {startup['seconds_to_ready']}s ({stages}).")
+    except Exception as e:
+        print(f"Startup Error: {e}")
+        startup["state"] = "failed"
+        startup["error"] = str(e)
+
+def require_ready():
+    """Dependency for endpoints that need the model, index or LLM client."""
+    if orchestrator is None:
+        detail = "Service failed to start." if startup["state"] == "failed" else "Service is starting up."
+        raise HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+# Gauges are read at scrape time (no sample while the service is still starting)
+telemetry.REGISTRY.gauge("rag_index_vectors", "Vectors in the live FAISS index.",
+                         lambda: rag_engine.index.ntotal if rag_engine.index is not None else 0)
+telemetry.REGISTRY.gauge("rag_indexed_files", "Files in the index manifest.", lambda: len(rag_engine.files))
+telemetry.REGISTRY.gauge("rag_index_deleted_chunks", "Deleted chunks still in the index, awaiting compaction.",
+                         lambda: rag_engine.snapshot.deleted_count)
+telemetry.REGISTRY.gauge("rag_index_version", "Index version this process is serving.",
+                         lambda: int(rag_engine.snapshot.version))
+telemetry.REGISTRY.gauge("rag_ingest_queue_depth", "Ingestion jobs waiting to run.", lambda: ingest_queue.pending())
+telemetry.REGISTRY.gauge("rag_llm_queue_depth", "LLM calls waiting for a generation slot.",
+                         lambda: llm_client.stats()["queue_depth"])
+telemetry.REGISTRY.gauge("rag_llm_in_flight", "LLM generations in progress.", lambda: llm_client.stats()["in_flight"])
+telemetry.REGISTRY.gauge("rag_answer_cache_entries", "Entries in the semantic answer cache.",
+                         lambda: answer_cache.stats()["entries"] if answer_cache else None)
 
 class QueryRequest(BaseModel):
     text: str
+    include_timings: bool = False  # Return a per-stage timing breakdown with the answer
 
 class QueryResponse(BaseModel):
     answer: str
@@ -28,14 +153,21 @@ class QueryResponse(BaseModel):
     refusal_reason: Optional[str] = None
     risk_level: str  # e.g., Low, Moderate, High
     disclaimer: str
+    timings: Optional[dict] = None
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Ensure documents are loaded
-    if rag_engine.index is None:
-        rag_engine._load_documents()
+    # Startup: load models and the index in the background so the port is
+    # bound right away; /readyz reports when queries can be served
+    if orchestrator is None:  # Not already warmed up by whoever imported the app
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    startup["seconds_to_listen"] = round(time.perf_counter() - _import_started, 3)
     yield
-    # Shutdown: cleanup if needed
+    # Shutdown: finish queued ingestion jobs and write out the answer cache
+    if ingest_queue is not None:
+        ingest_queue.stop()
+    if answer_cache is not None:
+        answer_cache.close()
 
 app = FastAPI(title="Explainable RAG Healthcare System", version="1.0.0", lifespan=lifespan)
 
@@ -48,13 +180,29 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
+@app.get("/healthz")
+async def healthz():
+    """
+    Liveness: the process is up and serving requests. 503 once warm-up has failed,
+    since the process can't recover from that without a restart.
+    """
+    if startup["state"] == "failed":
+        return JSONResponse({"status": "failed", "error": startup["error"]}, status_code=503)
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the index is loaded and the encoder warmed up. 503 until then."""
+    status_code = 200 if startup["state"] == "ready" else 503
+    return JSONResponse(startup, status_code=status_code)
+
+def save_upload(file: UploadFile) -> str:
+    """Validates an uploaded file and writes it into the data directory."""
     # Validate file type
     if not file.filename.endswith(('.pdf', '.txt')):
          raise HTTPException(status_code=400, detail="Only PDF and TXT files are supported.")
     
-    file_path = os.path.join(rag_engine.data_dir, file.filename)
+    file_path = os.path.join(rag_engine.data_dir, os.path.basename(file.filename))
     
     # Save file
     try:
@@ -62,59 +210,182 @@ async def upload_document(file: UploadFile = File(...)):
             shutil.copyfileobj(file.file, buffer)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
-        
-    # Index document
-    success, message = rag_engine.add_document(file_path)
-    if not success:
-         raise HTTPException(status_code=500, detail=message)
-         
-    return {"message": message, "filename": file.filename}
-
-@app.post("/query", response_model=QueryResponse)
+    return file_path
+
+@app.post("/upload", status_code=202, dependencies=[Depends(require_ready)])
+async def upload_document(file: UploadFile = File(...)):
+    file_path = await run_in_threadpool(save_upload, file)
+
+    # Index document in the background
+    job = ingest_queue.submit([file_path])
+    return {"message": "File accepted for indexing.", "filename": file.filename, "job_id": job.id}
+
+@app.post("/upload/bulk", status_code=202, dependencies=[Depends(require_ready)])
+async def upload_documents(files: List[UploadFile] = File(...)):
+    """Uploads several files as one job; their chunks are encoded together."""
+    for file in files:
+        if not file.filename.endswith(('.pdf', '.txt')):
+            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file.filename}")
+
+    file_paths = [await run_in_threadpool(save_upload, file) for file in files]
+    job = ingest_queue.submit(file_paths)
+    return {"message": f"{len(files)} files accepted for indexing.",
+            "filenames": [file.filename for file in files], "job_id": job.id}
+
+@app.get("/documents", dependencies=[Depends(require_ready)])
+async def list_documents():
+    """Indexed documents with their chunk counts."""
+    snapshot = rag_engine.snapshot
+    return {
+        "index_version": snapshot.version,
+        "documents": rag_engine.list_documents(),
+        "total_chunks": len(snapshot.documents) - snapshot.deleted_count,
+        "deleted_chunks": snapshot.deleted_count,
+    }
+
+@app.delete("/documents/{name:path}", dependencies=[Depends(require_ready)])
+async def delete_document(name: str):
+    """Removes a document and its chunks from the index (and from the data directory)."""
+    removed = await run_in_threadpool(rag_engine.delete_document, name)
+    if removed is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    return {"message": f"Deleted {name}.", "chunks_removed": removed}
+
+@app.get("/jobs/{job_id}", dependencies=[Depends(require_ready)])
+async def job_status(job_id: str):
+    """Status and progress (pages parsed, chunks embedded) of an ingestion job."""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job.to_dict()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: stage latencies, LLM token counts, index size, ingestion."""
+    return PlainTextResponse(telemetry.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats", dependencies=[Depends(require_ready)])
+async def cache_stats():
+    """Hit rates of the semantic answer cache and the chunk embedding cache."""
+    return {
+        "answer_cache": answer_cache.stats() if answer_cache else None,
+        "embedding_cache": rag_engine.embedding_cache.stats(),
+    }
+
+@app.get("/llm/stats", dependencies=[Depends(require_ready)])
+async def llm_stats():
+    """LLM client queue depth, in-flight generations, wait times, retries and coalesced calls."""
+    return llm_client.stats()
+
+def emergency_response(risk_level: str, disclaimer: str) -> QueryResponse:
+    return QueryResponse(
+        answer="**EMERGENCY ASSISTANCE REQUIRED**",
+        explanation="This query matches symptoms of a life-threatening medical emergency.",
+        confidence="High",
+        evidence=[],
+        is_safe=False,
+        refusal_reason="This query implies a medical emergency. Please call 911 immediately.",
+        risk_level=risk_level,
+        disclaimer=disclaimer
+    )
+
+def to_query_response(response_data: dict, risk_level: str, disclaimer: str) -> QueryResponse:
+    return QueryResponse(
+        answer=response_data.get("answer_summary", "Processing Error"),
+        explanation=response_data.get("detailed_explanation", ""),
+        confidence=response_data.get("confidence_score", "Low"),
+        evidence=response_data.get("evidence", []),
+        is_safe=True,
+        risk_level=risk_level,
+        disclaimer=disclaimer
+    )
+
+def error_response(e: Exception) -> QueryResponse:
+    return QueryResponse(
+        answer="An internal error occurred while processing your request.",
+        explanation=str(e),
+        confidence="Low",
+        evidence=[],
+        is_safe=True,
+        risk_level="Low",
+        disclaimer="System Error"
+    )
+
+def observe_request(endpoint: str, start: float):
+    if telemetry.REGISTRY.enabled:
+        telemetry.REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+@app.post("/query", response_model=QueryResponse, dependencies=[Depends(require_ready)])
 async def query_endpoint(request: QueryRequest):
     query_text = request.text
+    start = time.perf_counter()
+    trace = telemetry.start_trace() if request.include_timings else None
     
     # 1. Safety & Risk Check (FAST PATH)
-    risk_level, disclaimer = SafetyGuard.classify_risk(query_text)
+    with telemetry.span("safety"):
+        risk_level, disclaimer = SafetyGuard.classify_risk(query_text)
     
     if risk_level == "High":
-        return QueryResponse(
-            answer="**EMERGENCY ASSISTANCE REQUIRED**",
-            explanation="This query matches symptoms of a life-threatening medical emergency.",
-            confidence="High",
-            evidence=[],
-            is_safe=False,
-            refusal_reason="This query implies a medical emergency. Please call 911 immediately.",
-            risk_level=risk_level,
-            disclaimer=disclaimer
-        )
-    
-    # 2. Agentic Orchestration
-    # The orchestrator handles routing, retrieval, and answering
-    try:
-        response_data = await orchestrator.process_query(query_text, risk_level)
-        
-        return QueryResponse(
-            answer=response_data.get("answer_summary", "Processing Error"),
-            explanation=response_data.get("detailed_explanation", ""),
-            confidence=response_data.get("confidence_score", "Low"),
-            evidence=response_data.get("evidence", []),
-            is_safe=True,
-            risk_level=risk_level,
-            disclaimer=disclaimer
-        )
-    
-    except Exception as e:
-        print(f"Orchestrator Error: {e}")
-        return QueryResponse(
-            answer="An internal error occurred while processing your request.",
-            explanation=str(e),
-            confidence="Low",
-            evidence=[],
-            is_safe=True,
-            risk_level="Low",
-            disclaimer="System Error"
-        )
+        response = emergency_response(risk_level, disclaimer)
+    else:
+        # 2. Agentic Orchestration
+        # The orchestrator handles routing, retrieval, and answering
+        try:
+            response_data = await orchestrator.process_query(query_text, risk_level)
+            response = to_query_response(response_data, risk_level, disclaimer)
 
-# Set environment variable to disable progress bars
-os.environ["HF_HUB_DISABLE_PROGRESS_BARS"] = "1"
+        except Exception as e:
+            print(f"Orchestrator Error: {e}")
+            response = error_response(e)
+
+    observe_request("/query", start)
+    if trace:
+        response.timings = trace.breakdown()
+    return response
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream", dependencies=[Depends(require_ready)])
+async def query_stream_endpoint(request: QueryRequest):
+    """
+    Server-sent events version of /query. Emits "risk" immediately, "evidence"
+    once retrieval finishes, "token" for each answer fragment ({"field", "text"})
+    and a final "done" carrying the full QueryResponse (including confidence).
+    """
+    query_text = request.text
+
+    async def events():
+        start = time.perf_counter()
+        trace = telemetry.start_trace() if request.include_timings else None
+
+        def done(response: QueryResponse) -> str:
+            observe_request("/query/stream", start)
+            if trace:
+                response.timings = trace.breakdown()
+            return sse_event("done", response.model_dump())
+
+        with telemetry.span("safety"):
+            risk_level, disclaimer = SafetyGuard.classify_risk(query_text)
+        yield sse_event("risk", {"risk_level": risk_level, "disclaimer": disclaimer})
+
+        if risk_level == "High":
+            yield done(emergency_response(risk_level, disclaimer))
+            return
+
+        try:
+            async for event, data in orchestrator.stream_query(query_text, risk_level):
+                if event == "result":
+                    yield done(to_query_response(data, risk_level, disclaimer))
+                else:
+                    yield sse_event(event, data)
+
+        except Exception as e:
+            print(f"Orchestrator Error: {e}")
+            yield done(error_response(e))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
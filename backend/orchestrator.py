@@ -1,80 +1,243 @@
+import asyncio
+import time
+from typing import AsyncIterator, List, Optional, Tuple
+
 from agents import RouterAgent, RetrievalAgent, AnswerAgent
+from answer_cache import SemanticAnswerCache
+from context_packer import ContextPacker
+from intent_router import IntentRouter, load_prototypes
 from llm_client import LLMClient
-from rag_engine import RAGEngine
+from rag_engine import RAGEngine, Snapshot
+from telemetry import span
 
 
 class Orchestrator:
-    def __init__(self, rag_engine: RAGEngine, llm_client: LLMClient):
+    def __init__(self, rag_engine: RAGEngine, llm_client: LLMClient, speculative: bool = False,
+                 local_routing: bool = False, prototypes_path: Optional[str] = None,
+                 answer_cache: Optional[SemanticAnswerCache] = None,
+                 context_packer: Optional[ContextPacker] = None):
         self.rag = rag_engine
         self.llm = llm_client
+        self.answer_cache = answer_cache
+        # Run routing, query expansion and a baseline search concurrently
+        self.speculative = speculative
+
+        # Route with the retrieval encoder, falling back to the LLM when ambiguous.
+        # Off by default: a misroute answers a medical question without evidence,
+        # so enable it only once IntentRouter.evaluate has been run on a labeled set
+        local_router = None
+        if local_routing:
+            prototypes = load_prototypes(prototypes_path) if prototypes_path else None
+            local_router = IntentRouter(rag_engine.encoder, prototypes)
         
         # Initialize Agents
-        self.router = RouterAgent(llm_client)
+        self.router = RouterAgent(llm_client, local_router)
         self.retriever = RetrievalAgent(llm_client)
-        self.answer_gen = AnswerAgent(llm_client)
+        self.answer_gen = AnswerAgent(llm_client, context_packer)
 
     async def process_query(self, query: str, risk_level: str) -> dict:
         """
         Orchestrates the entire query lifecycle.
         """
         print(f"--- Processing Query: {query} (Risk: {risk_level}) ---")
-        
-        # 1. Route Intent
-        intent = self.router.route_query(query)
-        print(f"Detected Intent: {intent}")
+        # Every search for this request reads the same index version
+        snapshot = self.rag.snapshot
+        # Embedded once; the answer cache, the local router and the search reuse it
+        embedding = (await self.rag.aembed_queries([query]))[0]
+
+        cached = self._cache_lookup(embedding, risk_level, snapshot)
+        if cached is not None:
+            return cached
+
+        start = time.perf_counter()
+        response = await self._answer(query, embedding, risk_level, snapshot)
+        self._cache_store(embedding, risk_level, response, time.perf_counter() - start, snapshot)
+        return response
+
+    async def _answer(self, query: str, embedding, risk_level: str, snapshot: Snapshot) -> dict:
+        # 1-3. Route intent, then retrieve evidence for research queries
+        intent, all_docs = await self._route_and_retrieve(query, embedding, snapshot)
         
         if intent == "DIRECT_ANSWER":
-            return self.answer_gen.generate_response(query, [], risk_level, intent="DIRECT_ANSWER")
+            with span("answer"):
+                return await self.answer_gen.agenerate_response(query, [], risk_level, intent="DIRECT_ANSWER")
 
-        # 2. Retrieval Research (Intent == "RAG_RESEARCH")
-        search_queries = self.retriever.generate_queries(query)
-        print(f"Generated Search Queries: {search_queries}")
-        
-        # 3. Vector search with deduplication
-        all_docs = []
-        seen_content = set()
-        
-        for q in search_queries:
-            docs = self.rag.search(q, k=3)
-            for d in docs:
-                sig = d['content'][:50]
-                if sig not in seen_content:
-                    d["retrieval_method"] = "vector"
-                    all_docs.append(d)
-                    seen_content.add(sig)
-
-        # 4. Fallback
-        if not all_docs:
-             all_docs = self.rag.search(query, k=3)
-        
         if not all_docs:
-             return {
-                "answer_summary": "Insufficient evidence found.",
-                "detailed_explanation": "I could not find relevant medical documents to support an answer.",
-                "confidence_score": "Low",
-                "evidence_used": [],
-                "is_safe": True
-            }
-
-        # 5. Answer generation
-        response = self.answer_gen.generate_response(query, all_docs, risk_level)
-        
-        # Compute confidence from retrieval scores
-        if all_docs:
-            avg_score = sum(d.get("score", 0) for d in all_docs) / len(all_docs)
-            top_score = max(d.get("score", 0) for d in all_docs)
-            # Weighted: 60% top score, 40% average
-            combined = 0.6 * top_score + 0.4 * avg_score
-            if combined >= 0.55:
-                computed_confidence = "High"
-            elif combined >= 0.35:
-                computed_confidence = "Medium"
-            else:
-                computed_confidence = "Low"
-            response["confidence_score"] = computed_confidence
+             return self._insufficient_evidence()
+
+        # 4. Answer generation, from the chunks that fit the prompt
+        with span("answer"):
+            context = self.answer_gen.pack_context(all_docs, self._context_vectors(all_docs, snapshot))
+            response = await self.answer_gen.agenerate_response(query, context, risk_level)
+        return self._finalize(response, context)
+
+    async def stream_query(self, query: str, risk_level: str) -> AsyncIterator[Tuple[str, object]]:
+        """
+        Streaming variant of process_query. Yields (event, data) pairs:
+        "evidence" once retrieval finishes, "token" for each answer fragment,
+        and finally "result" with the same dict process_query would return.
+        """
+        print(f"--- Streaming Query: {query} (Risk: {risk_level}) ---")
+        snapshot = self.rag.snapshot
+        embedding = (await self.rag.aembed_queries([query]))[0]
+
+        cached = self._cache_lookup(embedding, risk_level, snapshot)
+        if cached is not None:
+            if cached.get("evidence"):
+                yield "evidence", cached["evidence"]
+            yield "result", cached
+            return
+
+        start = time.perf_counter()
+        intent, all_docs = await self._route_and_retrieve(query, embedding, snapshot)
+
+        if intent == "DIRECT_ANSWER":
+            context = []
+        elif not all_docs:
+            yield "result", self._insufficient_evidence()
+            return
+        else:
+            context = self.answer_gen.pack_context(all_docs, self._context_vectors(all_docs, snapshot))
+            yield "evidence", context[:4]
+
+        response = {}
+        with span("answer"):
+            async for event in self.answer_gen.astream_response(query, context, risk_level, intent=intent):
+                if event["type"] == "token":
+                    yield "token", {"field": event["field"], "text": event["text"]}
+                else:
+                    response = event["data"]
+
+        result = self._finalize(response, context) if context else response
+        self._cache_store(embedding, risk_level, result, time.perf_counter() - start, snapshot)
+        yield "result", result
+
+    def _cache_lookup(self, embedding, risk_level: str, snapshot: Snapshot) -> Optional[dict]:
+        """Returns the cached response for the query embedding, or None."""
+        if not self.answer_cache:
+            return None
+        with span("cache_lookup"):
+            cached = self.answer_cache.lookup(embedding, risk_level, snapshot.corpus_version)
+        if cached is not None:
+            print("Answer cache hit")
+        return cached
+
+    def _cache_store(self, embedding, risk_level: str, response: dict, latency: float, snapshot: Snapshot):
+        if self.answer_cache and embedding is not None and "error" not in response:
+            self.answer_cache.store(embedding, risk_level, snapshot.corpus_version, response, latency)
+
+    async def _route_and_retrieve(self, query: str, embedding, snapshot: Snapshot):
+        """Returns (intent, docs); docs is None for DIRECT_ANSWER."""
+        # 1. Route Intent (speculative mode also prefetches the retrieval)
+        if self.speculative:
+            intent, all_docs = await self._route_speculatively(query, embedding, snapshot)
+        else:
+            with span("routing"):
+                intent = await self.router.aroute_query(query, embedding)
+            all_docs = None
+        print(f"Detected Intent: {intent}")
+
+        if intent == "DIRECT_ANSWER":
+            return intent, None
+
+        # 2-3. Retrieval Research (Intent == "RAG_RESEARCH")
+        if all_docs is None:
+            with span("query_generation"):
+                search_queries = await self.retriever.agenerate_queries(query)
+            print(f"Generated Search Queries: {search_queries}")
+            # Batched vector search over the original + expanded queries,
+            # deduplicated by chunk id
+            with span("retrieval"):
+                all_docs = await self.rag.asearch_many([query] + self._as_list(search_queries), k=3,
+                                                       snapshot=snapshot, embedded=embedding)
+        for d in all_docs:
+            d["retrieval_method"] = "vector"
+        return intent, all_docs
+
+    def _context_vectors(self, docs: List[dict], snapshot: Snapshot):
+        """Stored embeddings of the retrieved chunks, for the context packer's duplicate check."""
+        if not docs or not self.answer_gen.packer:
+            return None
+        return self.rag.chunk_vectors([d["id"] for d in docs], snapshot)
+
+    @staticmethod
+    def _insufficient_evidence() -> dict:
+        return {
+            "answer_summary": "Insufficient evidence found.",
+            "detailed_explanation": "I could not find relevant medical documents to support an answer.",
+            "confidence_score": "Low",
+            "evidence_used": [],
+            "is_safe": True
+        }
+
+    @staticmethod
+    def _finalize(response: dict, context: List[dict]) -> dict:
+        """
+        Overrides the model's confidence with one computed from the retrieval
+        scores of `context`, the chunks the answer was generated from.
+        """
+        avg_score = sum(d.get("score", 0) for d in context) / len(context)
+        top_score = max(d.get("score", 0) for d in context)
+        # Weighted: 60% top score, 40% average
+        combined = 0.6 * top_score + 0.4 * avg_score
+        if combined >= 0.55:
+            computed_confidence = "High"
+        elif combined >= 0.35:
+            computed_confidence = "Medium"
+        else:
+            computed_confidence = "Low"
+        response["confidence_score"] = computed_confidence
         
         # Merge source docs into response for UI
-        response["evidence"] = all_docs[:4] # Limit to top 4 unique
+        response["evidence"] = context[:4] # Limit to top 4 unique
         response["is_safe"] = True
         
         return response
+
+    async def _route_speculatively(self, query: str, embedding, snapshot: Snapshot):
+        """
+        Starts routing, query expansion and a baseline search on the raw query at
+        the same time. Returns (intent, docs); docs is None for DIRECT_ANSWER, in
+        which case the speculative work is cancelled.
+        """
+        route_task = asyncio.create_task(self._timed("routing", self.router.aroute_query(query, embedding)))
+        queries_task = asyncio.create_task(self._timed("query_generation", self.retriever.agenerate_queries(query)))
+        baseline_task = asyncio.create_task(
+            self._timed("retrieval", self.rag.asearch_many([query], k=3, snapshot=snapshot, embedded=embedding)))
+
+        try:
+            intent = await route_task
+            if intent == "DIRECT_ANSWER":
+                return intent, None
+
+            search_queries = await queries_task
+            print(f"Generated Search Queries: {search_queries}")
+            baseline = await baseline_task
+            with span("retrieval"):
+                expanded = await self.rag.asearch_many(self._as_list(search_queries), k=3, snapshot=snapshot)
+            return intent, self._merge_results(baseline, expanded)
+        finally:
+            # No-op for finished tasks; drops the speculative work otherwise
+            for task in (route_task, queries_task, baseline_task):
+                task.cancel()
+
+    @staticmethod
+    async def _timed(stage: str, awaitable):
+        with span(stage):
+            return await awaitable
+
+    @staticmethod
+    def _as_list(search_queries) -> List[str]:
+        if isinstance(search_queries, str):
+            return [search_queries]
+        return list(search_queries)
+
+    @staticmethod
+    def _merge_results(*result_lists: List[dict]) -> List[dict]:
+        """Merges search results by chunk id, keeping the best score, sorted by score."""
+        best = {}
+        for results in result_lists:
+            for doc in results:
+                if doc["id"] not in best or doc["score"] > best[doc["id"]]["score"]:
+                    best[doc["id"]] = doc
+        return sorted(best.values(), key=lambda d: d["score"], reverse=True)
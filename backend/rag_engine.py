@@ -1,136 +1,726 @@
+import hashlib
 import os
 import glob
-from typing import List, Dict
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
 import faiss
 import numpy as np
-import pypdf
-from sentence_transformers import SentenceTransformer
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from encoders import Encoder, SentenceTransformerEncoder
+from index_store import IndexStore, file_digest
+from chunk_store import ChunkStore
+from embedding_cache import EmbeddingCache
+from document_parser import ParallelParser
+from telemetry import REGISTRY, INGEST_CHUNKS, INGEST_FILES, INGEST_SECONDS, run_in_executor, span
+
+
+class Snapshot:
+    """
+    One published version of the index: the FAISS index together with the
+    chunk store and file manifest it was built from. Snapshots are never
+    modified (writers publish a new one), so a request that holds on to one
+    sees the same index and chunks throughout, whatever is published meanwhile.
+    """
+
+    def __init__(self, version: Optional[str] = None, segment: Optional[str] = None, index=None,
+                 documents: Optional[ChunkStore] = None, files: Optional[List[Dict]] = None,
+                 deleted: Optional[List[List[int]]] = None, search_params=None,
+                 vectors: Optional[np.ndarray] = None):
+        self.version = version  # Store version name (None before anything is loaded)
+        self.segment = segment
+        self.index = index
+        self.documents = documents if documents is not None else ChunkStore.empty()  # Memory-mapped
+        self.files = files or []  # Manifest entries (path, hash, chunk id start + count)
+        self.deleted = deleted or []  # [start, count] ranges of tombstoned chunk ids
+        self.deleted_count = sum(count for _, count in self.deleted)
+        self.search_params = search_params  # FAISS search parameters skipping the tombstones
+        self.vectors = vectors  # Stored chunk embeddings, by chunk id (memory-mapped)
+
+        # Fingerprint of the files, changes whenever the corpus does
+        fingerprint = hashlib.sha256()
+        for entry in self.files:
+            fingerprint.update(f"{entry['path']}\0{entry['hash']}\0{entry['count']}\n".encode("utf-8"))
+        self.corpus_version = fingerprint.hexdigest()[:16] if version else None
+
+
+def _training_minimum(index) -> int:
+    """Fewest vectors FAISS can train `index` on: its k-means needs a point per centroid."""
+    index = faiss.downcast_index(index)
+    minimum = 1
+    if isinstance(index, faiss.IndexPreTransform):
+        for i in range(index.chain.size()):
+            transform = faiss.downcast_VectorTransform(index.chain.at(i))
+            if isinstance(transform, faiss.OPQMatrix):
+                minimum = max(minimum, 256)  # 8-bit sub-quantizers
+            elif isinstance(transform, faiss.PCAMatrix):
+                minimum = max(minimum, transform.d_out)
+        return max(minimum, _training_minimum(index.index))
+    if isinstance(index, faiss.IndexHNSW):
+        return _training_minimum(index.storage)
+    if isinstance(index, faiss.IndexIVF):
+        minimum = index.nlist
+    pq = getattr(index, "pq", None)
+    if pq is not None:
+        minimum = max(minimum, pq.ksub)
+    return minimum
 
 
 class RAGEngine:
-    def __init__(self, data_dir: str = "../data", model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(self, data_dir: str = "../data", model_name: str = "all-MiniLM-L6-v2",
+                 index_dir: str = "../index", embedding_cache_size: int = 100_000,
+                 embedding_cache_dtype: str = "float32", search_workers: int = 4,
+                 index_factory: str = "Flat", nprobe: int = 16, ef_search: int = 64,
+                 train_size: int = 100_000, parse_workers: Optional[int] = None,
+                 encoder: Optional[Encoder] = None, refresh_interval: float = 2.0,
+                 compact_ratio: float = 0.2):
         self.data_dir = data_dir
-        self.encoder = SentenceTransformer(model_name)
-        self.index = None
-        self.documents = []  # Stores metadata/content corresponding to index
+        # Embedding backend (full-precision PyTorch unless another encoder is passed in)
+        self.encoder = encoder or SentenceTransformerEncoder(model_name)
+        self.model_name = self.encoder.name
+        # The live index version; replaced as a whole, never modified in place
+        self.snapshot = Snapshot()
         self.chunk_size = 500
         self.chunk_overlap = 50
+
+        # FAISS index type, as an index_factory string ("Flat", "HNSW32",
+        # "IVF1024,Flat", "IVF1024,PQ48", "IVF1024,SQ8", ...). Vectors are
+        # L2-normalized and searched by inner product, i.e. cosine similarity.
+        self.index_factory = index_factory
+        self.index_config = None  # Stored config of the live index (see _index_config)
+        self.nprobe = nprobe          # IVF lists visited per query
+        self.ef_search = ef_search    # HNSW candidate list size per query
+        self.train_size = train_size  # Max vectors sampled to train IVF/PQ indexes
+
+        # Bounded pool for CPU-bound search work called from async code
+        self._search_executor = ThreadPoolExecutor(max_workers=search_workers, thread_name_prefix="rag-search")
+        # Serializes writers within this process (IndexStore.writer_lock does so across processes)
+        self._write_lock = threading.Lock()
+        self._install_lock = threading.Lock()
+        # Rebuild without tombstoned chunks once they exceed this fraction of the index
+        self.compact_ratio = compact_ratio
+        self._compaction = None
+        self.encode_batch_size = 256  # Chunks per encoder call during ingestion
+        # Text extraction on a process pool (defaults to one worker per core)
+        self.parser = ParallelParser(parse_workers)
         
         # Ensure data directory exists
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
+
+        self.store = IndexStore(index_dir)
+        self.embedding_cache = EmbeddingCache(
+            os.path.join(index_dir, "embedding_cache"),
+            self.model_name,
+            self.encoder.get_sentence_embedding_dimension(),
+            max_entries=embedding_cache_size,
+            dtype=embedding_cache_dtype,
+        )
             
         # Load or initialize
         self._load_documents()
 
+        # Pick up versions published by other processes sharing index_dir (e.g. other uvicorn workers)
+        self.refresh_interval = refresh_interval
+        self._closed = threading.Event()
+        if refresh_interval > 0:
+            threading.Thread(target=self._poll_versions, name="rag-index-refresh", daemon=True).start()
+        self._maybe_compact()
+
+    @property
+    def index(self):
+        return self.snapshot.index
+
+    @property
+    def documents(self) -> ChunkStore:
+        return self.snapshot.documents
+
+    @property
+    def files(self) -> List[Dict]:
+        return self.snapshot.files
+
+    @property
+    def corpus_version(self) -> Optional[str]:
+        return self.snapshot.corpus_version
+
+    def close(self):
+        """Stops polling for new index versions."""
+        self._closed.set()
+
+    def _poll_versions(self):
+        while not self._closed.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Index refresh failed: {e}")
+
+    def refresh(self) -> bool:
+        """
+        Switches to the published index version if it is newer than the live
+        one, e.g. after another process added documents. Returns whether it did.
+        """
+        version = self.store.current_version()
+        if version is None or (self.snapshot.version and version <= self.snapshot.version):
+            return False
+        loaded = self.store.load(self._snapshot_config(), None, version)
+        if loaded is None or not self._install(loaded):
+            return False
+        print(f"Switched to index version {version} ({self.index.ntotal} vectors).")
+        return True
+
+    def _install(self, loaded: Dict) -> bool:
+        """Makes a loaded store version the live snapshot, unless a newer one already is."""
+        index = loaded["index"]
+        self._tune_index(index)
+        with self._install_lock:
+            if self.snapshot.version and loaded["version"] <= self.snapshot.version:
+                return False
+            self.index_config = loaded["index_config"]
+            vectors = self.store.load_vectors(loaded["segment"], self.encoder.get_sentence_embedding_dimension(),
+                                              len(loaded["documents"]))
+            self.snapshot = Snapshot(loaded["version"], loaded["segment"], index,
+                                     loaded["documents"], loaded["files"], loaded["deleted"],
+                                     self._search_params(index, loaded["deleted"]), vectors)
+        return True
+
+    def _search_params(self, index, deleted: List[List[int]]):
+        """FAISS search parameters excluding tombstoned chunk ids (None without tombstones)."""
+        if not deleted:
+            return None
+        ids = np.concatenate([np.arange(start, start + count, dtype="int64") for start, count in deleted])
+        batch = faiss.IDSelectorBatch(ids)
+        selector = faiss.IDSelectorNot(batch)
+        params = self._params_for(index, selector)
+        params.referenced_objects = [batch, selector]  # The SWIG objects don't keep each other alive
+        return params
+
+    def _params_for(self, index, selector):
+        """Search parameters of the right type for `index`, carrying its query-time settings."""
+        index = faiss.downcast_index(index)
+        if isinstance(index, faiss.IndexPreTransform):
+            params = faiss.SearchParametersPreTransform()
+            params.index_params = inner = self._params_for(index.index, selector)
+            params.sel = selector
+            params.inner = inner
+            return params
+        if isinstance(index, faiss.IndexIVF):
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        if isinstance(index, faiss.IndexHNSW):
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        return faiss.SearchParameters(sel=selector)
+
+    def _snapshot_config(self) -> Dict:
+        """Settings that must match for a stored snapshot to be reusable."""
+        return {
+            "model": self.model_name,
+            "dim": self.encoder.get_sentence_embedding_dimension(),
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+        }
+
+    def _index_config(self, fallback: bool = False) -> Dict:
+        config = {"factory": self.index_factory, "metric": "inner_product"}
+        if fallback:
+            # A flat index stands in until there are enough vectors to train the configured type
+            config["fallback"] = True
+        return config
+
+    def _build_index(self, vectors: np.ndarray, dim: int, block_size: int = 65536) -> Tuple[object, Dict]:
+        """
+        Creates the configured FAISS index and adds `vectors` (possibly memory-mapped)
+        to it block by block, training it on a random sample first if the index type
+        needs training. Falls back to an exact flat index while the corpus is too
+        small to train on. Returns the index and its config for the manifest.
+        """
+        index = faiss.index_factory(dim, self.index_factory, faiss.METRIC_INNER_PRODUCT)
+        index_config = self._index_config()
+
+        if not index.is_trained:
+            rows = np.arange(len(vectors))
+            if len(vectors) > self.train_size:
+                rows = np.sort(np.random.default_rng(0).choice(len(vectors), self.train_size, replace=False))
+            minimum = _training_minimum(index)
+            try:
+                if len(rows) < minimum:
+                    raise RuntimeError(f"it needs at least {minimum}")
+                sample = self._normalized(vectors[rows])
+                print(f"Training {self.index_factory} index on {len(sample)} vectors...")
+                index.train(sample)
+                del sample
+            except RuntimeError as e:
+                print(f"Cannot train {self.index_factory} on {len(rows)} vectors ({e}); using a flat index.")
+                index = faiss.IndexFlatIP(dim)
+                index_config = self._index_config(fallback=True)
+
+        self._tune_index(index)
+        for start in range(0, len(vectors), block_size):
+            index.add(self._normalized(vectors[start:start + block_size]))
+        return index, index_config
+
+    def _can_train(self, index_config: Dict, ntotal: int) -> bool:
+        """Whether a flat stand-in index now has enough vectors to train the configured type on."""
+        if not index_config.get("fallback"):
+            return False
+        index = faiss.index_factory(self.encoder.get_sentence_embedding_dimension(), self.index_factory,
+                                    faiss.METRIC_INNER_PRODUCT)
+        return min(ntotal, self.train_size) >= _training_minimum(index)
+
+    def _tune_index(self, index):
+        """Applies the query-time search parameters that the index type supports."""
+        params = faiss.ParameterSpace()
+        for name, value in (("nprobe", self.nprobe), ("efSearch", self.ef_search)):
+            try:
+                params.set_index_parameter(index, name, value)
+            except RuntimeError:
+                pass  # Parameter does not apply to this index type
+
+    @staticmethod
+    def _normalized(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.array(vectors, dtype='float32')
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def _scan_files(self) -> Dict[str, os.stat_result]:
+        """Returns the indexable files under data_dir, keyed by relative path."""
+        files = glob.glob(os.path.join(self.data_dir, "**/*.*"), recursive=True)
+        return {
+            os.path.relpath(file_path, self.data_dir): os.stat(file_path)
+            for file_path in sorted(files)
+            if file_path.endswith(('.txt', '.pdf'))
+        }
+
+    def _file_entry(self, rel_path: str, stat: os.stat_result, previous: Optional[Dict]) -> Dict:
+        """Builds a manifest entry, only hashing the file if size or mtime changed."""
+        if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+            digest = previous["hash"]
+        else:
+            digest = file_digest(os.path.join(self.data_dir, rel_path))
+        return {"path": rel_path, "hash": digest, "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns, "count": 0}
+
     def _load_documents(self):
-        """Loads text files from data directory, chunks them, and builds FAISS index."""
+        """
+        Brings the FAISS index in line with the data directory.
+        Reuses the published snapshot and only re-embeds files that are new or changed;
+        files that disappeared from data_dir are dropped. Runs under the store's writer
+        lock, so of several processes starting at once only the first rebuilds.
+        """
+        with self._write_lock, self.store.writer_lock():
+            self._sync_with_data_dir()
+
+    def _sync_with_data_dir(self):
         print(f"Loading documents from {self.data_dir}...")
-        files = glob.glob(os.path.join(self.data_dir, "**/*.*"), recursive=True)
-        
-        self.documents = [] # Reset documents
-        all_chunks = []
-        
-        for file_path in files:
-            if file_path.endswith(('.txt', '.pdf')):
-                chunks, metadata = self._process_file(file_path)
-                if chunks:
-                    all_chunks.extend(chunks)
-                    self.documents.extend(metadata)
-
-        if not all_chunks:
+        config = self._snapshot_config()
+        current = self._scan_files()
+        snapshot = self.store.load(config, self._index_config())
+        previous = {entry["path"]: entry for entry in (snapshot["files"] if snapshot else [])}
+
+        entries = []
+        for rel_path, stat in current.items():
+            prev = previous.get(rel_path)
+            entry = self._file_entry(rel_path, stat, prev)
+            if prev and prev["hash"] == entry["hash"]:
+                entry["start"], entry["count"] = prev["start"], prev["count"]
+            entries.append(entry)
+
+        if snapshot and self._same_files(entries, snapshot["files"]):
+            if snapshot["index"] is None or self._can_train(snapshot["index_config"], len(snapshot["documents"])):
+                snapshot = self._rebuild_index(config, snapshot)
+            self._install(snapshot)
+            print(f"Loaded index version {snapshot['version']} with {self.index.ntotal} vectors.")
+            return
+        self._rebuild(config, entries, snapshot)
+
+    def _rebuild_index(self, config: Dict, snapshot: Dict) -> Dict:
+        """
+        Builds the configured index type over the stored vectors of `snapshot` (a
+        loaded store version) and swaps it into that version; the chunks are
+        unchanged, so nothing is re-embedded or republished. Returns the version
+        reloaded. Must be called with the store's writer lock held.
+        """
+        vectors = self.store.load_vectors(snapshot["segment"], config["dim"], len(snapshot["documents"]))
+        index, index_config = self._build_index(vectors, config["dim"])
+        if snapshot["index"] is not None and index_config == snapshot["index_config"]:
+            return snapshot  # Still too few vectors to train on
+        self.store.replace_index(snapshot["version"], index_config, index)
+        del index
+        print(f"Rebuilt the index of version {snapshot['version']} for {self.index_factory}.")
+        return self.store.load(config, None, snapshot["version"])
+
+    def _rebuild(self, config: Dict, entries: List[Dict], snapshot: Optional[Dict]):
+        """
+        Builds and publishes a new segment and index holding the chunks of
+        `entries`, in that order. Files whose entry has the same hash as in
+        `snapshot` (a loaded store version) are copied from its segment,
+        including their embeddings; the others are parsed and embedded.
+        Tombstoned chunks of `snapshot` are left behind. Must be called with
+        the store's writer lock held.
+        """
+        previous = {entry["path"]: entry for entry in (snapshot["files"] if snapshot else [])}
+        old_vectors = None
+        if snapshot:
+            old_vectors = self.store.load_vectors(snapshot["segment"], config["dim"], len(snapshot["documents"]))
+        changed = {
+            os.path.join(self.data_dir, entry["path"]): entry for entry in entries
+            if not (entry["path"] in previous and previous[entry["path"]]["hash"] == entry["hash"])
+        }
+        if changed:
+            print(f"Parsing and embedding {len(changed)} new or changed files...")
+
+        # Chunks and embeddings are streamed into the new segment file by file:
+        # unchanged files first, copied from the old segment, then the others
+        # as soon as they are embedded; ids are assigned in that order
+        with self.store.new_segment() as segment:
+            reused = 0
+            for entry in entries:
+                prev = previous.get(entry["path"])
+                if prev and prev["hash"] == entry["hash"]:
+                    start, count = prev["start"], prev["count"]
+                    entry["start"], entry["count"] = segment.count, count
+                    segment.add(snapshot["documents"].iter_range(start, count), old_vectors[start:start + count])
+                    reused += 1
+            for file_path, chunks, embeddings in self._iter_ingested(list(changed)):
+                changed[file_path]["start"], changed[file_path]["count"] = segment.count, len(chunks)
+                segment.add(chunks, embeddings)
+                # Bounds the embeddings the cache holds in memory during a large rebuild
+                self.embedding_cache.flush(min_pending=10_000)
+            for entry in changed.values():
+                entry.setdefault("start", segment.count)  # No extractable text
+        entries.sort(key=lambda entry: entry["start"])
+        if segment.count == 0:
             print("No documents found.")
-            # Initialize empty index
-            self.index = faiss.IndexFlatL2(384) # Default dimension for MiniLM
+
+        # Initialize FAISS from the memory-mapped embeddings, publish it as a new
+        # version and serve that (memory-mapped)
+        index, index_config = self._build_index(self.store.load_vectors(segment.name, config["dim"], segment.count),
+                                                config["dim"])
+        version = self.store.publish_segment(config, index_config, entries, segment, index)
+        del index
+        self._install(self.store.load(config, None, version))
+        self.embedding_cache.flush()
+
+        cache = self.embedding_cache.stats()
+        print(f"Index version {version} built with {self.index.ntotal} vectors "
+              f"({reused} unchanged files reused, {len(entries) - reused} embedded; "
+              f"embedding cache {cache['hits']} hits / {cache['misses']} misses).")
+
+    def _encode_chunks(self, chunks: List[str]) -> np.ndarray:
+        """Embeds document chunks, skipping the encoder for chunks seen before."""
+        return self.embedding_cache.encode(chunks, self.encoder.encode)
+
+    @staticmethod
+    def _same_files(entries: List[Dict], stored: List[Dict]) -> bool:
+        keys = sorted((e["path"], e["hash"]) for e in entries)
+        return keys == sorted((e["path"], e["hash"]) for e in stored)
+
+    def _iter_ingested(self, file_paths: List[str],
+                       progress: Optional[Dict] = None) -> Iterator[Tuple[str, List[Tuple[str, str]], np.ndarray]]:
+        """
+        Parses files on the process pool and embeds their chunks in fixed-size
+        batches (spanning files) while parsing is still under way. Yields
+        (file_path, chunks, embeddings) for every file that produced chunks, in
+        input order, as soon as all of its chunks are embedded; chunks are
+        (source, content) pairs. Only the files whose chunks are not all
+        embedded yet are held in memory, not the whole input.
+        """
+        progress = progress if progress is not None else {}
+        progress.setdefault("chunks_total", 0)
+        progress.setdefault("chunks_embedded", 0)
+        if not file_paths:
             return
 
-        print(f"Encoding {len(all_chunks)} chunks...")
-        embeddings = self.encoder.encode(all_chunks)
-        
-        # Initialize FAISS
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(np.array(embeddings).astype('float32'))
-        
-        print(f"Index built with {self.index.ntotal} vectors.")
+        pending = OrderedDict()  # file_path -> (chunks, embeddings), in parse order
+        batch = []  # (file_path, chunk)
 
-    def _process_file(self, file_path: str):
-        """Extracts text from a file and returns chunks + metadata."""
-        text = ""
-        try:
-            if file_path.endswith('.pdf'):
-                reader = pypdf.PdfReader(file_path)
-                for page in reader.pages:
-                    text += page.extract_text() + "\n"
-            else:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    text = f.read()
-            
-            if not text.strip():
-                return [], []
+        def encode_batch():
+            vectors = self._encode_chunks([chunk for _, chunk in batch])
+            for (file_path, chunk), vector in zip(batch, vectors):
+                chunks, embeddings = pending[file_path]
+                chunks.append((os.path.basename(file_path), chunk))
+                embeddings.append(vector)
+            progress["chunks_embedded"] += len(batch)
+            batch.clear()
 
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=self.chunk_size, 
-                chunk_overlap=self.chunk_overlap
-            )
-            
-            chunks = splitter.split_text(text)
-            source_name = os.path.basename(file_path)
-            
-            metadata_list = [{"source": source_name, "content": chunk} for chunk in chunks]
-            return chunks, metadata_list
-            
-        except Exception as e:
-            print(f"Error reading {file_path}: {e}")
-            return [], []
+        def completed(parsing: Optional[str]):
+            # Files come out of the parser one after another, so every file ahead
+            # of the one being parsed is complete once none of its chunks await encoding
+            while pending:
+                file_path = next(iter(pending))
+                if file_path == parsing or (batch and batch[0][0] == file_path):
+                    return
+                chunks, embeddings = pending.pop(file_path)
+                yield file_path, chunks, np.array(embeddings, dtype='float32')
+
+        for file_path, chunk in self.parser.iter_chunks(file_paths, self.chunk_size,
+                                                        self.chunk_overlap, progress):
+            pending.setdefault(file_path, ([], []))
+            batch.append((file_path, chunk))
+            progress["chunks_total"] += 1
+            if len(batch) >= self.encode_batch_size:
+                encode_batch()
+                yield from completed(file_path)
+        if batch:
+            encode_batch()
+        yield from completed(None)
 
     def add_document(self, file_path: str):
         """Adds a new document to the index dynamically."""
-        print(f"Adding document: {file_path}")
-        chunks, metadata = self._process_file(file_path)
-        
-        if not chunks:
-            return False, "Failed to extract text from file."
+        return self.add_documents([file_path])
 
-        embeddings = self.encoder.encode(chunks)
-        
-        # Add to FAISS
-        if self.index is None:
-             self.index = faiss.IndexFlatL2(embeddings.shape[1])
+    def add_documents(self, file_paths: List[str], progress: Optional[Dict] = None):
+        """
+        Adds several documents at once. Files are parsed in parallel and chunks from
+        all of them are encoded together in fixed-size batches, then published to the
+        live index in a single step. A file that is already indexed under the same
+        name replaces the earlier version (its old chunks are tombstoned); one with
+        unchanged content is skipped. Files without extractable text are recorded
+        with no chunks, so they replace earlier versions too and are not parsed
+        again on the next startup.
+        `progress`, if given, is updated in place with pages_parsed, chunks_total
+        and chunks_embedded so callers can report on long-running ingestion.
+        """
+        progress = progress if progress is not None else {}
+        progress.update(pages_parsed=0, chunks_total=0, chunks_embedded=0)
+        start = time.perf_counter()
 
-        start_idx = len(self.documents)
-        self.index.add(np.array(embeddings).astype('float32'))
-        self.documents.extend(metadata)
-        
-        print(f"Added {len(chunks)} chunks to index.")
-        return True, f"Successfully indexed {len(chunks)} chunks."
+        file_paths = list(dict.fromkeys(file_paths))
+        entries = {
+            file_path: self._file_entry(os.path.relpath(file_path, self.data_dir), os.stat(file_path), None)
+            for file_path in file_paths
+        }
+        indexed = {(entry["path"], entry["hash"]) for entry in self.snapshot.files}
+        unchanged = [p for p in file_paths if (entries[p]["path"], entries[p]["hash"]) in indexed]
+        if unchanged and len(unchanged) == len(file_paths):
+            return True, "Already indexed; the content has not changed."
+
+        file_paths = [p for p in file_paths if p not in unchanged]
+        for file_path in file_paths:
+            print(f"Adding document: {file_path}")
+        parsed = list(self._iter_ingested(file_paths, progress))
+        parsed_paths = {file_path for file_path, _, _ in parsed}
+        empty = [file_path for file_path in file_paths if file_path not in parsed_paths]
+
+        dim = self.encoder.get_sentence_embedding_dimension()
+        embeddings = np.concatenate([vectors for _, _, vectors in parsed] or [np.zeros((0, dim), dtype='float32')])
+        total_chunks = len(embeddings)
+
+        with self._write_lock, self.store.writer_lock():
+            self.embedding_cache.flush()
+            # Build on the published version, which another process may have advanced
+            self.refresh()
+            base = self.snapshot
+
+            # Add to a private copy of the index (an already trained index just takes
+            # the new vectors) and publish it as a new version; the live snapshot is
+            # never touched, so searches never see a half-added batch
+            index_config = self.index_config
+            if not parsed:
+                index = None  # Unchanged
+            elif self._can_train(index_config, len(base.documents) + total_chunks):
+                # Enough vectors now to replace the flat stand-in with the configured type
+                index, index_config = self._build_index(np.concatenate([base.vectors, embeddings]), dim)
+            else:
+                index = self.store.read_index(base.version)
+                self._tune_index(index)
+                index.add(self._normalized(embeddings))
+
+            # Record the files in the manifest so the next startup does not re-embed
+            # them; earlier versions of the same files are tombstoned
+            new_paths = {entries[file_path]["path"] for file_path in file_paths}
+            files = [entry for entry in base.files if entry["path"] not in new_paths]
+            deleted = base.deleted + [[entry["start"], entry["count"]] for entry in base.files
+                                      if entry["path"] in new_paths and entry["count"]]
+            replaced = len(base.files) - len(files)
+            offset = len(base.documents)
+            for file_path, chunks, _ in parsed:
+                entry = entries[file_path]
+                entry["start"], entry["count"] = offset, len(chunks)
+                offset += len(chunks)
+                files.append(entry)
+            for file_path in empty:
+                entries[file_path]["start"] = offset
+                files.append(entries[file_path])
+
+            # The new chunks are appended to the segment files; older versions only
+            # cover the chunks before them, so their readers are unaffected
+            config = self._snapshot_config()
+            if parsed:
+                version = self.store.append(config, index_config, files, deleted,
+                                            base.version, base.segment, base.documents,
+                                            [chunk for _, chunks, _ in parsed for chunk in chunks],
+                                            index, embeddings)
+            else:
+                version = self.store.publish_deletions(config, index_config, files, deleted,
+                                                       base.version, base.segment, len(base.documents))
+            del index
+            self._install(self.store.load(config, None, version))
+        self._maybe_compact()
+
+        if not parsed:
+            message = "Failed to extract text from file."
+            if replaced:
+                message += f" Removed {replaced} earlier version(s) from the index."
+            return False, message
+
+        if REGISTRY.enabled:
+            INGEST_CHUNKS.inc(total_chunks)
+            INGEST_FILES.inc(len(parsed))
+            INGEST_SECONDS.observe(time.perf_counter() - start)
+
+        print(f"Added {total_chunks} chunks to index.")
+        message = f"Successfully indexed {total_chunks} chunks."
+        if len(file_paths) > 1:
+            message = f"Successfully indexed {total_chunks} chunks from {len(parsed)} files."
+        if replaced:
+            message += f" Replaced {replaced} earlier version(s)."
+        if unchanged:
+            message += f" {len(unchanged)} file(s) already indexed and unchanged."
+        if empty:
+            message += f" {len(empty)} file(s) had no extractable text."
+        return True, message
+
+    def list_documents(self) -> List[Dict]:
+        """Indexed files with their chunk counts, in index order."""
+        return [{"name": entry["path"], "chunks": entry["count"], "size": entry["size"], "hash": entry["hash"]}
+                for entry in self.snapshot.files]
+
+    def delete_document(self, name: str) -> Optional[int]:
+        """
+        Removes a file from the data directory and its chunks from the index by
+        publishing a version with them tombstoned. Returns the number of chunks
+        removed, or None if no such file is indexed.
+        """
+        with self._write_lock, self.store.writer_lock():
+            self.refresh()
+            base = self.snapshot
+            removed = [entry for entry in base.files if entry["path"] == name]
+            if not removed:
+                return None
+
+            # Gone from data_dir first, so a crash before publishing can't bring it back
+            file_path = os.path.join(self.data_dir, name)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            files = [entry for entry in base.files if entry["path"] != name]
+            deleted = base.deleted + [[entry["start"], entry["count"]] for entry in removed if entry["count"]]
+            config = self._snapshot_config()
+            version = self.store.publish_deletions(config, self.index_config, files, deleted,
+                                                   base.version, base.segment, len(base.documents))
+            self._install(self.store.load(config, None, version))
+        self._maybe_compact()
+
+        count = sum(entry["count"] for entry in removed)
+        print(f"Deleted {name} ({count} chunks).")
+        return count
+
+    def _maybe_compact(self):
+        """Starts a background compaction once tombstones exceed compact_ratio of the index."""
+        snapshot = self.snapshot
+        if snapshot.deleted_count <= self.compact_ratio * len(snapshot.documents):
+            return
+        with self._install_lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._compaction = threading.Thread(target=self.compact, name="rag-index-compaction", daemon=True)
+            self._compaction.start()
+
+    def compact(self):
+        """
+        Rebuilds the published version into a new segment and index without its
+        tombstoned chunks. Embeddings are copied over, so nothing is re-encoded.
+        """
+        try:
+            with self._write_lock, self.store.writer_lock():
+                self.refresh()
+                if not self.snapshot.deleted:
+                    return
+                config = self._snapshot_config()
+                snapshot = self.store.load(config, None, self.snapshot.version)
+                print(f"Compacting index version {snapshot['version']} "
+                      f"({self.snapshot.deleted_count} deleted chunks)...")
+                self._rebuild(config, [dict(entry) for entry in snapshot["files"]], snapshot)
+        except Exception as e:
+            print(f"Index compaction failed: {e}")
+
+    def chunk_vectors(self, ids: List[int], snapshot: Optional[Snapshot] = None) -> Optional[np.ndarray]:
+        """Stored embeddings of the chunks with the given ids, row for row, without re-encoding."""
+        snapshot = snapshot or self.snapshot
+        if snapshot.vectors is None or not len(ids):
+            return None
+        return np.array(snapshot.vectors[list(ids)])
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Encodes queries into L2-normalized float32 vectors (cosine = dot product)."""
+        with span("embed"):
+            vectors = np.array(self.encoder.encode(list(queries))).astype('float32')
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    async def aembed_queries(self, queries: List[str]) -> np.ndarray:
+        """Runs embed_queries on the search executor without blocking the event loop."""
+        return await run_in_executor(self._search_executor, self.embed_queries, queries)
+
+    async def asearch_many(self, queries: List[str], k: int = 3, snapshot: Optional[Snapshot] = None,
+                           embedded: Optional[np.ndarray] = None) -> List[Dict]:
+        """Runs search_many on the search executor without blocking the event loop."""
+        return await run_in_executor(self._search_executor, self.search_many, queries, k, snapshot, embedded)
 
     def search(self, query: str, k: int = 3) -> List[Dict]:
         """Retrieves top-k relevant chunks with normalized relevance scores."""
-        if not self.index or self.index.ntotal == 0:
+        return self.search_many([query], k=k)
+
+    def search_many(self, queries: List[str], k: int = 3, snapshot: Optional[Snapshot] = None,
+                    embedded: Optional[np.ndarray] = None) -> List[Dict]:
+        """
+        Retrieves the top-k chunks for several queries at once.
+        All queries are encoded in one batch and searched with a single FAISS call;
+        hits are deduplicated by index id (keeping the best score) and sorted by score.
+        Searches `snapshot` if given (callers making several searches pass the one
+        they started with), otherwise the live one. `embedded` holds the
+        embeddings (from embed_queries) of the leading queries, if already computed.
+        """
+        snapshot = snapshot or self.snapshot
+        index, documents = snapshot.index, snapshot.documents
+        if not queries or not index or index.ntotal == 0:
             return []
 
-        query_vector = self.encoder.encode([query])
-        D, I = self.index.search(np.array(query_vector).astype('float32'), k)
-        
-        results = []
-        for i, idx in enumerate(I[0]):
-            if idx != -1 and idx < len(self.documents):
-                doc = self.documents[idx]
-                # Convert L2 distance to 0-1 similarity score
-                # L2 distance: 0 = identical, higher = less similar
-                # Using exponential decay: score = e^(-distance/scale)
-                l2_dist = float(D[0][i])
+        if embedded is None:
+            vectors = self.embed_queries(queries)
+        else:
+            vectors = np.asarray(embedded, dtype="float32").reshape(-1, index.d)
+            if len(vectors) < len(queries):
+                vectors = np.vstack([vectors, self.embed_queries(queries[len(vectors):])])
+        with span("faiss_search"):
+            if snapshot.search_params is not None:
+                D, I = index.search(vectors, k, params=snapshot.search_params)
+            else:
+                D, I = index.search(vectors, k)
+
+        best = {}
+        for row in range(len(queries)):
+            for cosine, idx in zip(D[row], I[row]):
+                if idx == -1 or idx >= len(documents):
+                    continue
+                # Convert to a 0-1 similarity score via the squared L2 distance of
+                # the unit vectors (0 = identical, 4 = opposite), 2 - 2 * cosine,
+                # using exponential decay: score = e^(-distance/scale)
+                l2_dist = 2.0 - 2.0 * float(cosine)
                 similarity = float(np.exp(-l2_dist / 2.0))  # scale factor 2.0
                 similarity = round(max(0.0, min(1.0, similarity)), 3)
-                
-                results.append({
-                    "content": doc["content"],
-                    "source": doc["source"],
-                    "score": similarity,  # 0-1 where 1 = perfect match
-                    "relevance": "High" if similarity >= 0.6 else "Medium" if similarity >= 0.35 else "Low"
-                })
+                if idx not in best or similarity > best[idx]:
+                    best[idx] = similarity
+
+        results = []
+        for idx, similarity in sorted(best.items(), key=lambda item: item[1], reverse=True):
+            doc = documents[idx]
+            results.append({
+                "id": int(idx),
+                "content": doc["content"],
+                "source": doc["source"],
+                "score": similarity,  # 0-1 where 1 = perfect match
+                "relevance": "High" if similarity >= 0.6 else "Medium" if similarity >= 0.35 else "Low"
+            })
         
         # Filter out very low relevance results
         results = [r for r in results if r["score"] >= 0.15]
@@ -1,26 +1,28 @@
+import os
 import re
 from enum import Enum
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, Optional
 
 class RiskLevel(str, Enum):
     LOW = "Low"             # General information (e.g., "benefits of yoga")
     MODERATE = "Moderate"   # Symptom checking / medical questions (e.g., "fever remedies")
     HIGH = "High"           # Emergency / Critical (e.g., "heart attack symptoms")
 
+LEXICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lexicons")
+
+
+def load_lexicon(path: str) -> List[str]:
+    """Reads one term per line, skipping blank lines and # comments."""
+    with open(path, "r", encoding="utf-8") as f:
+        terms = [line.strip().lower() for line in f]
+    return [term for term in terms if term and not term.startswith("#")]
+
+
 # Emergency keywords trigger immediate refusal/alert
-EMERGENCY_KEYWORDS = [
-    "suicide", "kill myself", "want to die", "overdose", 
-    "heart attack", "stroke", "difficulty breathing", "severe bleeding",
-    "poison", "unconscious", "call 911", "chest pain", "crushing pain",
-    "seizure", "anaphylaxis", "severe burn"
-]
+EMERGENCY_KEYWORDS = load_lexicon(os.path.join(LEXICON_DIR, "emergency.txt"))
 
 # Diagnostic intents for Moderate risk detection
-DIAGNOSTIC_KEYWORDS = [
-    "symptom", "diagnosis", "do i have", "treatment", "cure", 
-    "medicine", "pills", "therapy", "pain", "hurt", "swollen", 
-    "rash", "fever", "infection"
-]
+DIAGNOSTIC_KEYWORDS = load_lexicon(os.path.join(LEXICON_DIR, "diagnostic.txt"))
 
 DISCLAIMERS = {
     RiskLevel.LOW: "This information is for educational purposes only.",
@@ -28,24 +30,122 @@ DISCLAIMERS = {
     RiskLevel.HIGH: "⚠️ EMERGENCY PROTOCOL: This query indicates a potential medical emergency."
 }
 
+class LexiconMatcher:
+    """
+    Finds every lexicon term in a text with one compiled regex.
+
+    The terms are merged into a character trie and emitted as nested
+    alternations, so the regex engine follows a single trie path per text
+    position instead of trying each term in turn; the cost per query stays
+    nearly flat as lexicons grow to thousands of phrases. Matches must start
+    and end on word boundaries; a term ending in "*" also matches longer
+    words ("symptom*" matches "symptoms"), and one starting with "*" also
+    matches at the end of a compound word ("*stroke" matches "heatstroke").
+    Spaces inside a phrase match any run of whitespace. Overlapping terms
+    resolve to the longest match.
+    """
+
+    def __init__(self, lexicons: Dict[RiskLevel, List[str]]):
+        # Later lexicons win when the same term appears twice, so pass them
+        # from lowest to highest risk. Terms are kept apart by whether they
+        # must start on a word boundary ("bounded") or not ("infix")
+        self.terms = {"bounded": {}, "infix": {}}     # normalized term -> risk level
+        self.prefixes = {"bounded": {}, "infix": {}}  # stem of "stem*" terms -> risk level
+        for level, terms in lexicons.items():
+            for term in terms:
+                term = " ".join(term.lower().split())
+                kind = "bounded"
+                if term.startswith("*"):
+                    kind, term = "infix", term[1:].lstrip()
+                if term.endswith("*"):
+                    self.prefixes[kind][term[:-1].rstrip()] = level
+                elif term:
+                    self.terms[kind][term] = level
+
+        self.patterns = []
+        for kind, start in (("bounded", r"(?<!\w)"), ("infix", "")):
+            trie = {}
+            for term, end in ([(t, "exact") for t in self.terms[kind]]
+                              + [(t, "prefix") for t in self.prefixes[kind]]):
+                node = trie
+                for char in term:
+                    node = node.setdefault(char, {})
+                if node.get("") != "prefix":
+                    node[""] = end
+            if trie:
+                self.patterns.append((kind, re.compile(start + self._compile(trie) + r"(?!\w)")))
+
+    @classmethod
+    def _compile(cls, node: Dict) -> str:
+        branches = [
+            (r"\s+" if char == " " else re.escape(char)) + cls._compile(child)
+            for char, child in sorted(node.items()) if char != ""
+        ]
+        end = node.get("")
+        if end == "prefix":
+            # Longer matches first: the trie branches, then any word continuation
+            branches.append(r"\w*")
+        if not branches:
+            return ""
+        if len(branches) == 1 and end != "exact":
+            return branches[0]
+        # An exact term ending here makes the rest optional
+        return "(?:" + "|".join(branches) + (")?" if end == "exact" else ")")
+
+    def find_all(self, text: str) -> List[Tuple[str, RiskLevel]]:
+        """Returns (term, risk level) for every match, in text order."""
+        text = text.lower()
+        matches = []
+        for kind, pattern in self.patterns:
+            for match in pattern.finditer(text):
+                matched = " ".join(match.group().split())
+                matches.append((match.start(), self._resolve(kind, matched)))
+        return [term for _, term in sorted(matches, key=lambda m: m[0])]
+
+    def _resolve(self, kind: str, matched: str) -> Tuple[str, RiskLevel]:
+        lead = "*" if kind == "infix" else ""
+        if matched in self.terms[kind]:
+            return lead + matched, self.terms[kind][matched]
+        # Matched through a "stem*" term: find the longest stem it extends
+        prefixes = self.prefixes[kind]
+        for end in range(len(matched), 0, -1):
+            if matched[:end] in prefixes:
+                return lead + matched[:end] + "*", prefixes[matched[:end]]
+        raise KeyError(matched)
+
+
 class SafetyGuard:
-    @staticmethod
-    def classify_risk(query: str) -> Tuple[RiskLevel, str]:
+    # Compiled once; replaced by load_lexicons
+    matcher = LexiconMatcher({RiskLevel.MODERATE: DIAGNOSTIC_KEYWORDS, RiskLevel.HIGH: EMERGENCY_KEYWORDS})
+
+    @classmethod
+    def load_lexicons(cls, emergency_path: Optional[str] = None, diagnostic_path: Optional[str] = None):
+        """Replaces the built-in keyword lists with lexicon files (one term per line)."""
+        emergency = load_lexicon(emergency_path) if emergency_path else EMERGENCY_KEYWORDS
+        diagnostic = load_lexicon(diagnostic_path) if diagnostic_path else DIAGNOSTIC_KEYWORDS
+        cls.matcher = LexiconMatcher({RiskLevel.MODERATE: diagnostic, RiskLevel.HIGH: emergency})
+        print(f"Loaded safety lexicons: {len(emergency)} emergency, {len(diagnostic)} diagnostic terms.")
+
+    @classmethod
+    def match_terms(cls, query: str) -> List[Tuple[str, RiskLevel]]:
+        """All lexicon terms found in the query, with the risk level of each."""
+        return cls.matcher.find_all(query)
+
+    @classmethod
+    def classify_risk(cls, query: str) -> Tuple[RiskLevel, str]:
         """
         Classifies the query risk level and returns the appropriate disclaimer/warning.
         """
-        query_lower = query.lower()
-        
+        levels = {level for _, level in cls.match_terms(query)}
+
         # 1. Check HIGH Risk (Emergency)
-        for kw in EMERGENCY_KEYWORDS:
-            if kw in query_lower:
-                return RiskLevel.HIGH, DISCLAIMERS[RiskLevel.HIGH]
-        
+        if RiskLevel.HIGH in levels:
+            return RiskLevel.HIGH, DISCLAIMERS[RiskLevel.HIGH]
+
         # 2. Check MODERATE Risk (Diagnostic/Treatment)
-        for kw in DIAGNOSTIC_KEYWORDS:
-            if kw in query_lower:
-                return RiskLevel.MODERATE, DISCLAIMERS[RiskLevel.MODERATE]
-                
+        if RiskLevel.MODERATE in levels:
+            return RiskLevel.MODERATE, DISCLAIMERS[RiskLevel.MODERATE]
+
         # 3. Default to LOW Risk
         return RiskLevel.LOW, DISCLAIMERS[RiskLevel.LOW]
 
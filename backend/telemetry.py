@@ -0,0 +1,292 @@
+import asyncio
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Stage latencies range from sub-millisecond searches to multi-second generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in values]
+
+
+class Gauge(_Metric):
+    """A gauge whose value is read from a callback at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def _samples(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        return [] if value is None else [f"{self.name} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., count above the last bucket, sum];
+        # made cumulative only when rendered
+        self._series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[slot] += 1
+            series[-1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        lines = []
+        inf = 'le="+Inf"'
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            total = cumulative + values[-2]
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {total}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(values[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {total}")
+        return lines
+
+
+class Registry:
+    """
+    Holds the process's metrics and renders them in the Prometheus text
+    format. While `enabled` is False, spans are no-ops (unless a request
+    asked for its own timing breakdown) and nothing is recorded.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, documentation, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Time spent in each query pipeline stage.", ["stage"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "rag_request_seconds", "End-to-end request latency.", ["endpoint"])
+LLM_PROMPT_TOKENS = REGISTRY.counter(
+    "rag_llm_prompt_tokens_total", "Prompt tokens evaluated by the LLM.", ["stage"])
+LLM_COMPLETION_TOKENS = REGISTRY.counter(
+    "rag_llm_completion_tokens_total", "Tokens generated by the LLM.", ["stage"])
+LLM_PROMPT_EVAL_SECONDS = REGISTRY.histogram(
+    "rag_llm_prompt_eval_seconds", "LLM prompt evaluation time reported by Ollama.", ["stage"])
+LLM_EVAL_SECONDS = REGISTRY.histogram(
+    "rag_llm_eval_seconds", "LLM generation time reported by Ollama.", ["stage"])
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "rag_llm_queue_wait_seconds", "Time LLM calls waited for a free generation slot.")
+LLM_EVENTS = REGISTRY.counter(
+    "rag_llm_events_total", "LLM calls that were coalesced, retried, timed out or failed.", ["event"])
+INGEST_CHUNKS = REGISTRY.counter(
+    "rag_ingest_chunks_total", "Chunks embedded and added to the index.")
+INGEST_FILES = REGISTRY.counter(
+    "rag_ingest_files_total", "Files added to the index.")
+INGEST_SECONDS = REGISTRY.histogram(
+    "rag_ingest_seconds", "Time to parse, embed and index one batch of uploaded files.",
+    buckets=(0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0))
+
+
+class Trace:
+    """Timing breakdown of a single request, filled in by the spans it runs."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}  # stage -> total seconds (stages may run several times)
+        self.llm_calls = []
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def breakdown(self) -> Dict:
+        return {
+            "total_ms": round((time.perf_counter() - self.start) * 1000, 2),
+            "stages_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()},
+            "llm_calls": self.llm_calls,
+        }
+
+
+_trace = contextvars.ContextVar("rag_trace", default=None)
+_stage = contextvars.ContextVar("rag_stage", default=None)
+
+
+class _Span:
+    __slots__ = ("stage", "trace", "start", "token")
+
+    def __init__(self, stage: str, trace: Optional[Trace]):
+        self.stage = stage
+        self.trace = trace
+
+    def __enter__(self):
+        self.token = _stage.set(self.stage)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        try:
+            _stage.reset(self.token)
+        except ValueError:
+            pass  # Exited from another context, e.g. a generator closed by a different task
+        if REGISTRY.enabled:
+            STAGE_SECONDS.observe(seconds, stage=self.stage)
+        if self.trace is not None:
+            self.trace.add(self.stage, seconds)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(stage: str):
+    """Context manager timing one pipeline stage."""
+    trace = _trace.get()
+    if not REGISTRY.enabled and trace is None:
+        return _NULL_SPAN
+    return _Span(stage, trace)
+
+
+def start_trace() -> Trace:
+    """Starts collecting a timing breakdown for the current request (and tasks it spawns)."""
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def record_llm_call(metadata: Dict, seconds: float):
+    """
+    Records the token counts and durations Ollama reports for a generation
+    (the response_metadata of a ChatOllama message; durations are in ns),
+    attributed to the enclosing stage.
+    """
+    trace = _trace.get()
+    if not REGISTRY.enabled and trace is None:
+        return
+    stage = _stage.get() or "unknown"
+    prompt_tokens = metadata.get("prompt_eval_count") or 0
+    completion_tokens = metadata.get("eval_count") or 0
+    prompt_eval = (metadata.get("prompt_eval_duration") or 0) / 1e9
+    evaluation = (metadata.get("eval_duration") or 0) / 1e9
+
+    if REGISTRY.enabled:
+        LLM_PROMPT_TOKENS.inc(prompt_tokens, stage=stage)
+        LLM_COMPLETION_TOKENS.inc(completion_tokens, stage=stage)
+        if "prompt_eval_duration" in metadata:
+            LLM_PROMPT_EVAL_SECONDS.observe(prompt_eval, stage=stage)
+        if "eval_duration" in metadata:
+            LLM_EVAL_SECONDS.observe(evaluation, stage=stage)
+    if trace is not None:
+        trace.llm_calls.append({
+            "stage": stage,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "prompt_eval_ms": round(prompt_eval * 1000, 2),
+            "eval_ms": round(evaluation * 1000, 2),
+            "wall_ms": round(seconds * 1000, 2),
+        })
+
+
+async def run_in_executor(executor, fn, *args):
+    """loop.run_in_executor that carries the current trace/stage into the worker thread."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args))
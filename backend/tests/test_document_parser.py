@@ -0,0 +1,97 @@
+import random
+
+import pytest
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.e2e import synthetic_document
+from document_parser import ParallelParser, StreamingSplitter, _offset_splitter_class
+
+CHUNK_SIZE, CHUNK_OVERLAP = 500, 50
+
+# Few distinct words, so the same text recurs all over a document
+VOCABULARY = ["treatment.", "dose", "insulin", "of", "blood glucose", "\n", "\n\n", " "]
+
+
+def document(rng: random.Random, shape: str) -> str:
+    if shape == "prose":
+        return synthetic_document(rng, 20000)
+    if shape == "paragraphs":  # Some longer than a chunk
+        return "\n\n".join(synthetic_document(rng, rng.randint(100, 1500)) for _ in range(20))
+    if shape == "lines":
+        return "\n".join(synthetic_document(rng, rng.randint(20, 300)) for _ in range(120))
+    return "".join(synthetic_document(rng, rng.randint(50, 900)) + rng.choice(["\n", "\n\n", " ", "\n \n"])
+                   for _ in range(60))
+
+
+def page_breaks(rng: random.Random, text: str) -> list:
+    """Random points to cut `text` at, mid-word included, like page breaks."""
+    return sorted(rng.sample(range(1, len(text)), len(text) // 1500))
+
+
+def split_whole(text: str, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP) -> list:
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap).split_text(text)
+
+
+def repetitive_document(rng: random.Random) -> str:
+    words = rng.choices(VOCABULARY, weights=[6, 6, 6, 6, 3, rng.random(), rng.random(), 20], k=rng.randint(200, 3000))
+    return " ".join(words)
+
+
+def stream(text: str, cuts: list, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, window=8) -> list:
+    splitter = StreamingSplitter(chunk_size, chunk_overlap, window)
+    chunks = []
+    for start, end in zip([0] + cuts, cuts + [len(text)]):
+        chunks.extend(splitter.feed(text[start:end]))
+    chunks.extend(splitter.flush())
+    return chunks
+
+
+@pytest.mark.parametrize("shape", ["prose", "paragraphs", "lines", "mixed"])
+@pytest.mark.parametrize("seed", range(10))
+def test_streamed_chunks_match_whole_document_split(shape, seed):
+    rng = random.Random(seed)
+    text = document(rng, shape)
+    assert stream(text, page_breaks(rng, text)) == split_whole(text)
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_streamed_chunks_match_in_repetitive_text(seed):
+    rng = random.Random(seed)
+    text = repetitive_document(rng)
+    chunk_size = rng.choice([40, 100, 500])
+    chunk_overlap = rng.choice([0, chunk_size // 10, chunk_size // 3])
+    cuts = sorted(rng.sample(range(1, len(text)), rng.randint(1, len(text) // 20)))
+    window = rng.choice([1, 2, 8])
+    assert stream(text, cuts, chunk_size, chunk_overlap, window) == split_whole(text, chunk_size, chunk_overlap)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_offsets_locate_each_chunk(seed):
+    text = repetitive_document(random.Random(seed))
+    splitter = _offset_splitter_class()(chunk_size=100, chunk_overlap=30)
+    split = splitter.split_with_offsets(text)
+    assert [chunk for _, chunk in split] == split_whole(text, 100, 30)
+    for start, chunk in split:
+        assert text[start:].lstrip().startswith(chunk)
+
+
+def test_short_document_is_only_split_on_flush():
+    splitter = StreamingSplitter(CHUNK_SIZE, CHUNK_OVERLAP)
+    assert splitter.feed("A short page. ") == []
+    assert splitter.feed("And another.") == []
+    assert splitter.flush() == ["A short page. And another."]
+    assert splitter.flush() == []
+
+
+def test_parser_chunks_files_in_order(tmp_path):
+    rng = random.Random(0)
+    texts = [document(rng, shape) for shape in ("prose", "paragraphs", "lines")]
+    paths = []
+    for i, text in enumerate(texts):
+        path = tmp_path / f"doc{i}.txt"
+        path.write_text(text, encoding="utf-8")
+        paths.append(str(path))
+    paths.append(str(tmp_path / "missing.txt"))
+
+    chunks = list(ParallelParser(workers=1).iter_chunks(paths, CHUNK_SIZE, CHUNK_OVERLAP))
+    assert chunks == [(path, chunk) for path, text in zip(paths, texts) for chunk in split_whole(text)]
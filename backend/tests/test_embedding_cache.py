@@ -0,0 +1,86 @@
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+
+
+class CountingEncoder:
+    def __init__(self, dim=8):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(text) + i for i in range(self.dim)] for text in texts], dtype="float32")
+
+
+def test_embeds_each_distinct_text_once(tmp_path):
+    encoder = CountingEncoder()
+    cache = EmbeddingCache(str(tmp_path), "m", encoder.dim)
+    first = cache.encode(["a", "bb", "a"], encoder)
+    second = cache.encode(["bb", "ccc"], encoder)
+    assert encoder.calls == [["a", "bb"], ["ccc"]]
+    np.testing.assert_array_equal(first[1], second[0])
+    assert cache.stats()["entries"] == 3
+
+
+def test_nothing_is_written_before_flush(tmp_path):
+    encoder = CountingEncoder()
+    writer = EmbeddingCache(str(tmp_path), "m", encoder.dim)
+    writer.encode(["a"], encoder)
+    assert writer.pending() == 1
+    assert not (tmp_path / EmbeddingCache.KEYS).exists() or "a" not in (tmp_path / EmbeddingCache.KEYS).read_text()
+
+    writer.flush()
+    assert writer.pending() == 0
+    reader = EmbeddingCache(str(tmp_path), "m", encoder.dim)
+    reader.encode(["a"], encoder)
+    assert encoder.calls == [["a"]]
+
+
+def test_flush_respects_min_pending(tmp_path):
+    encoder = CountingEncoder()
+    cache = EmbeddingCache(str(tmp_path), "m", encoder.dim)
+    cache.encode(["a", "b"], encoder)
+    cache.flush(min_pending=3)
+    assert cache.pending() == 2
+    cache.flush(min_pending=2)
+    assert cache.pending() == 0
+
+
+def test_processes_sharing_a_directory_keep_each_others_entries(tmp_path):
+    encoder = CountingEncoder()
+    # Both opened before either writes, like two workers starting together
+    first = EmbeddingCache(str(tmp_path), "m", encoder.dim)
+    second = EmbeddingCache(str(tmp_path), "m", encoder.dim)
+    first.flush()
+    second.flush()
+
+    expected = first.encode(["one", "two"], encoder)
+    first.flush()
+    second.encode(["three"], encoder)
+    second.flush()  # Picks up the key table `first` wrote instead of reusing its slots
+
+    reopened = EmbeddingCache(str(tmp_path), "m", encoder.dim)
+    calls = len(encoder.calls)
+    np.testing.assert_array_equal(reopened.encode(["one", "two"], encoder), expected)
+    reopened.encode(["three"], encoder)
+    assert len(encoder.calls) == calls
+    # `first` still reads its own entries from the shared file
+    first.encode(["one", "two", "three"], encoder)
+    assert len(encoder.calls) == calls
+
+
+def test_slot_reused_by_another_process_is_a_miss(tmp_path):
+    encoder = CountingEncoder()
+    first = EmbeddingCache(str(tmp_path), "m", encoder.dim, max_entries=2)
+    second = EmbeddingCache(str(tmp_path), "m", encoder.dim, max_entries=2)
+    first.encode(["a", "b"], encoder)
+    first.flush()
+    second.flush()
+    second.encode(["c", "d"], encoder)
+    second.flush()  # Evicts "a" and "b"
+
+    calls = len(encoder.calls)
+    vectors = first.encode(["a", "c"], encoder)
+    assert encoder.calls[calls:] == [["a"]]
+    np.testing.assert_array_equal(vectors, encoder(["a", "c"]))
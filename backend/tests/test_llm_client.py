@@ -0,0 +1,185 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+import pytest
+
+from llm_client import JSONFieldStream, SlotLimiter
+
+FIELDS = ("answer_summary", "detailed_explanation")
+
+
+def stream(text: str, pieces: list, fields=FIELDS) -> dict:
+    """Feeds `text` cut at `pieces` and joins the fragments per field."""
+    parser = JSONFieldStream(fields)
+    streamed = {}
+    for start, end in zip([0] + pieces, pieces + [len(text)]):
+        for field, fragment in parser.feed(text[start:end]):
+            streamed[field] = streamed.get(field, "") + fragment
+    return streamed
+
+
+def random_cuts(text: str, seed: int) -> list:
+    rng = random.Random(seed)
+    return sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 40))))
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_field_stream_matches_parsed_json(seed):
+    response = {
+        "answer_summary": 'Insulin lowers "blood glucose".\nSee \\ notes, caf\u00e9 \u2014 done.',
+        "detailed_explanation": "Type 1 {braces} and [brackets], colons: commas, too.",
+        "confidence_score": "High",
+        "evidence_used": ["answer_summary", {"answer_summary": "nested"}],
+    }
+    text = json.dumps(response, ensure_ascii=seed % 2 == 0, indent=seed % 3 or None)
+    streamed = stream(text, random_cuts(text, seed))
+    assert streamed == {field: response[field] for field in FIELDS}
+
+
+def test_field_stream_one_character_at_a_time():
+    text = '{"answer_summary": "Tab\\there \\u00e9 \\"q\\"", "other": "x"}'
+    assert stream(text, list(range(1, len(text)))) == {"answer_summary": json.loads(text)["answer_summary"]}
+
+
+def test_field_stream_ignores_nested_and_unrequested_fields():
+    text = json.dumps({"meta": {"answer_summary": "inner"}, "detailed_explanation": "outer",
+                       "list": [{"detailed_explanation": "also inner"}]})
+    assert stream(text, random_cuts(text, 0)) == {"detailed_explanation": "outer"}
+
+
+def test_field_stream_emits_while_the_value_is_incomplete():
+    parser = JSONFieldStream(FIELDS)
+    assert parser.feed('{"answer_summary": "Drink wa') == [("answer_summary", "Drink wa")]
+    assert parser.feed('ter') == [("answer_summary", "ter")]
+    assert parser.feed('.", "detailed_explanation": ""}') == [("answer_summary", ".")]
+
+
+class Peak:
+    """Tracks how many holders a limiter has at once."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = 0
+        self.max = 0
+
+    def enter(self):
+        with self._lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+
+    def leave(self):
+        with self._lock:
+            self.current -= 1
+
+
+def test_limiter_caps_threads_and_event_loop_together():
+    limiter = SlotLimiter(2)
+    peak = Peak()
+
+    def blocking_call():
+        assert limiter.acquire(5.0)
+        peak.enter()
+        time.sleep(0.02)
+        peak.leave()
+        limiter.release()
+
+    async def async_call():
+        await limiter.acquire_async(5.0)
+        peak.enter()
+        await asyncio.sleep(0.02)
+        peak.leave()
+        limiter.release()
+
+    async def main():
+        await asyncio.gather(*(async_call() for _ in range(6)))
+
+    threads = [threading.Thread(target=blocking_call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    asyncio.run(main())
+    for thread in threads:
+        thread.join()
+
+    assert peak.max == 2
+    assert limiter.acquire(0) and limiter.acquire(0) and not limiter.acquire(0)
+
+
+def test_blocking_acquire_times_out():
+    limiter = SlotLimiter(1)
+    assert limiter.acquire(0)
+    assert not limiter.acquire(0.01)
+    limiter.release()
+    assert limiter.acquire(0)
+
+
+def test_async_acquire_times_out_without_leaking_a_slot():
+    limiter = SlotLimiter(1)
+
+    async def main():
+        await limiter.acquire_async(1.0)
+        with pytest.raises(asyncio.TimeoutError):
+            await limiter.acquire_async(0.01)
+        limiter.release()
+        await limiter.acquire_async(0.1)
+
+    asyncio.run(main())
+    assert not limiter.acquire(0)
+
+
+def test_cancelled_async_waiter_does_not_hold_a_slot():
+    limiter = SlotLimiter(1)
+
+    async def main():
+        await limiter.acquire_async(1.0)
+        waiter = asyncio.create_task(limiter.acquire_async(5.0))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+        await limiter.acquire_async(0.1)
+
+    asyncio.run(main())
+    assert not limiter.acquire(0)
+
+
+def test_waiter_cancelled_as_it_is_granted_a_slot():
+    limiter = SlotLimiter(1)
+
+    async def main():
+        await limiter.acquire_async(1.0)
+        waiter = asyncio.create_task(limiter.acquire_async(5.0))
+        await asyncio.sleep(0)
+        limiter.release()
+        waiter.cancel()
+        # Either the cancellation wins and the slot goes back, or the waiter got it
+        result, = await asyncio.gather(waiter, return_exceptions=True)
+        if not isinstance(result, asyncio.CancelledError):
+            limiter.release()
+        await limiter.acquire_async(0.1)
+
+    asyncio.run(main())
+    assert not limiter.acquire(0)
+
+
+def test_released_slot_goes_to_the_longest_waiter():
+    limiter = SlotLimiter(1)
+    order = []
+
+    async def waiter(name):
+        await limiter.acquire_async(5.0)
+        order.append(name)
+        limiter.release()
+
+    async def main():
+        await limiter.acquire_async(1.0)
+        tasks = [asyncio.create_task(waiter(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert order == ["a", "b", "c"]
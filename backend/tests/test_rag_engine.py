@@ -0,0 +1,243 @@
+import random
+
+import pytest
+
+from benchmarks.e2e import synthetic_document
+from benchmarks.fakes import HashingEncoder
+from rag_engine import RAGEngine
+
+MARKER = "zebra quartz marker"
+
+
+class CountingEncoder(HashingEncoder):
+    """HashingEncoder that counts the texts it embeds."""
+
+    def __init__(self):
+        super().__init__()
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        self.encoded += len(texts)
+        return super().encode(texts, **kwargs)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    path = tmp_path / "data"
+    path.mkdir()
+    rng = random.Random(0)
+    for i in range(3):
+        (path / f"doc{i}.txt").write_text(synthetic_document(rng, 3000), encoding="utf-8")
+    return path
+
+
+def open_engine(tmp_path, data_dir, encoder=None, **kwargs):
+    return RAGEngine(str(data_dir), index_dir=str(tmp_path / "index"), encoder=encoder or HashingEncoder(),
+                     refresh_interval=0, **kwargs)
+
+
+def marker_hits(engine):
+    return [doc for doc in engine.search_many([MARKER], k=10) if MARKER in doc["content"]]
+
+
+def check_consistent(engine):
+    """The live index, chunk store and file entries agree."""
+    snapshot = engine.snapshot
+    live = sum(entry["count"] for entry in snapshot.files)
+    assert len(snapshot.documents) == live + snapshot.deleted_count
+    assert engine.index.ntotal == len(snapshot.documents)
+    for entry in snapshot.files:
+        for i in range(entry["start"], entry["start"] + entry["count"]):
+            assert snapshot.documents[i]["source"] == entry["path"]
+
+
+def test_builds_index_from_data_dir(tmp_path, data_dir):
+    engine = open_engine(tmp_path, data_dir)
+    try:
+        assert [doc["name"] for doc in engine.list_documents()] == ["doc0.txt", "doc1.txt", "doc2.txt"]
+        assert all(doc["chunks"] > 0 for doc in engine.list_documents())
+        check_consistent(engine)
+    finally:
+        engine.close()
+
+
+def test_restart_reuses_the_published_index(tmp_path, data_dir):
+    open_engine(tmp_path, data_dir).close()
+    encoder = CountingEncoder()
+    engine = open_engine(tmp_path, data_dir, encoder)
+    try:
+        assert encoder.encoded == 0
+        check_consistent(engine)
+    finally:
+        engine.close()
+
+
+def test_add_document(tmp_path, data_dir):
+    engine = open_engine(tmp_path, data_dir)
+    try:
+        path = data_dir / "new.txt"
+        path.write_text(f"{MARKER}. " * 20, encoding="utf-8")
+        ok, message = engine.add_documents([str(path)])
+        assert ok, message
+        assert {doc["source"] for doc in marker_hits(engine)} == {"new.txt"}
+        check_consistent(engine)
+
+        version = engine.snapshot.version
+        ok, message = engine.add_documents([str(path)])
+        assert ok and "Already indexed" in message
+        assert engine.snapshot.version == version
+    finally:
+        engine.close()
+
+
+def test_replace_document_tombstones_old_chunks(tmp_path, data_dir):
+    engine = open_engine(tmp_path, data_dir, compact_ratio=1.0)
+    try:
+        path = data_dir / "doc0.txt"
+        old_text = path.read_text(encoding="utf-8")
+        old_count = engine.list_documents()[0]["chunks"]
+        path.write_text(f"{MARKER}. " * 20, encoding="utf-8")
+        ok, message = engine.add_documents([str(path)])
+        assert ok and "Replaced 1" in message
+
+        assert engine.snapshot.deleted_count == old_count
+        hits = engine.search_many([old_text[:200], MARKER], k=50)
+        doc0 = [doc for doc in hits if doc["source"] == "doc0.txt"]
+        assert doc0 and all(MARKER in doc["content"] for doc in doc0)
+        assert [doc["name"] for doc in engine.list_documents()] == ["doc1.txt", "doc2.txt", "doc0.txt"]
+        check_consistent(engine)
+    finally:
+        engine.close()
+
+
+def test_delete_document(tmp_path, data_dir):
+    engine = open_engine(tmp_path, data_dir, compact_ratio=1.0)
+    try:
+        count = engine.list_documents()[1]["chunks"]
+        assert engine.delete_document("doc1.txt") == count
+        assert not (data_dir / "doc1.txt").exists()
+        assert "doc1.txt" not in {doc["source"] for doc in engine.search_many(["glucose insulin"], k=50)}
+        assert engine.delete_document("doc1.txt") is None
+        check_consistent(engine)
+    finally:
+        engine.close()
+
+    # Still deleted after a restart
+    engine = open_engine(tmp_path, data_dir)
+    try:
+        assert [doc["name"] for doc in engine.list_documents()] == ["doc0.txt", "doc2.txt"]
+    finally:
+        engine.close()
+
+
+def test_compaction_drops_tombstones_without_reencoding(tmp_path, data_dir):
+    encoder = CountingEncoder()
+    engine = open_engine(tmp_path, data_dir, encoder, compact_ratio=1.0)
+    try:
+        path = data_dir / "doc2.txt"
+        path.write_text(f"{MARKER}. " * 20, encoding="utf-8")
+        engine.add_documents([str(path)])
+        engine.delete_document("doc0.txt")
+        files = [(doc["name"], doc["chunks"]) for doc in engine.list_documents()]
+        encoded = encoder.encoded
+
+        engine.compact()
+        assert encoder.encoded == encoded
+        assert engine.snapshot.deleted_count == 0
+        assert [(doc["name"], doc["chunks"]) for doc in engine.list_documents()] == files
+        assert engine.index.ntotal == sum(count for _, count in files)
+        assert {doc["source"] for doc in marker_hits(engine)} == {"doc2.txt"}
+        check_consistent(engine)
+    finally:
+        engine.close()
+
+
+def test_file_without_text_replaces_earlier_version(tmp_path, data_dir):
+    engine = open_engine(tmp_path, data_dir, compact_ratio=1.0)
+    try:
+        count = engine.list_documents()[0]["chunks"]
+        (data_dir / "doc0.txt").write_text("  \n\n ", encoding="utf-8")
+        ok, message = engine.add_documents([str(data_dir / "doc0.txt")])
+        assert not ok and "Removed 1" in message
+        assert engine.snapshot.deleted_count == count
+        assert [(doc["name"], doc["chunks"]) for doc in engine.list_documents()][-1] == ("doc0.txt", 0)
+        assert "doc0.txt" not in {doc["source"] for doc in engine.search_many(["glucose insulin"], k=50)}
+        check_consistent(engine)
+        version = engine.snapshot.version
+    finally:
+        engine.close()
+
+    # Recorded, so a restart reuses the published version
+    encoder = CountingEncoder()
+    engine = open_engine(tmp_path, data_dir, encoder)
+    try:
+        assert engine.snapshot.version == version
+        assert encoder.encoded == 0
+    finally:
+        engine.close()
+
+
+def test_new_file_without_text_is_recorded(tmp_path, data_dir):
+    engine = open_engine(tmp_path, data_dir)
+    try:
+        (data_dir / "empty.txt").write_text("", encoding="utf-8")
+        ok, message = engine.add_documents([str(data_dir / "empty.txt")])
+        assert not ok
+        assert ("empty.txt", 0) in [(doc["name"], doc["chunks"]) for doc in engine.list_documents()]
+        check_consistent(engine)
+        version = engine.snapshot.version
+    finally:
+        engine.close()
+
+    engine = open_engine(tmp_path, data_dir)
+    try:
+        assert engine.snapshot.version == version
+    finally:
+        engine.close()
+
+
+def test_untrainable_index_type_falls_back_without_republishing(tmp_path, data_dir):
+    # The three documents make fewer chunks than the 64 IVF lists need to train
+    first = open_engine(tmp_path, data_dir, index_factory="IVF64,Flat")
+    version = first.snapshot.version
+    assert first.index_config == {"factory": "IVF64,Flat", "metric": "inner_product", "fallback": True}
+    first.close()
+
+    encoder = CountingEncoder()
+    engine = open_engine(tmp_path, data_dir, encoder, index_factory="IVF64,Flat")
+    try:
+        assert engine.snapshot.version == version
+        assert engine.index_config.get("fallback")
+        assert encoder.encoded == 0
+
+        # Training is retried once there are enough vectors
+        rng = random.Random(1)
+        paths = []
+        for i in range(10):
+            path = data_dir / f"more{i}.txt"
+            path.write_text(synthetic_document(rng, 3000), encoding="utf-8")
+            paths.append(str(path))
+        ok, message = engine.add_documents(paths)
+        assert ok, message
+        assert engine.index.ntotal >= 64
+        assert engine.index_config == {"factory": "IVF64,Flat", "metric": "inner_product"}
+        check_consistent(engine)
+    finally:
+        engine.close()
+
+
+def test_changed_index_type_rebuilds_only_the_index(tmp_path, data_dir):
+    first = open_engine(tmp_path, data_dir)
+    version = first.snapshot.version
+    first.close()
+
+    encoder = CountingEncoder()
+    engine = open_engine(tmp_path, data_dir, encoder, index_factory="IVF4,Flat")
+    try:
+        assert engine.snapshot.version == version
+        assert encoder.encoded == 0
+        assert engine.index_config == {"factory": "IVF4,Flat", "metric": "inner_product"}
+        assert engine.index.ntotal == len(engine.snapshot.documents)
+        check_consistent(engine)
+    finally:
+        engine.close()
@@ -0,0 +1,84 @@
+import pytest
+
+from safety import LexiconMatcher, RiskLevel, SafetyGuard
+
+# The keyword lists SafetyGuard matched as substrings before the lexicon files
+BASELINE_EMERGENCY = [
+    "suicide", "kill myself", "want to die", "overdose",
+    "heart attack", "stroke", "difficulty breathing", "severe bleeding",
+    "poison", "unconscious", "call 911", "chest pain", "crushing pain",
+    "seizure", "anaphylaxis", "severe burn",
+]
+BASELINE_DIAGNOSTIC = [
+    "symptom", "diagnosis", "do i have", "treatment", "cure",
+    "medicine", "pills", "therapy", "pain", "hurt", "swollen",
+    "rash", "fever", "infection",
+]
+
+
+@pytest.mark.parametrize("term", BASELINE_EMERGENCY)
+def test_baseline_emergency_terms_are_high(term):
+    assert SafetyGuard.classify_risk(f"what to do about {term} right now")[0] == RiskLevel.HIGH
+
+
+@pytest.mark.parametrize("query", [
+    "found him in a state of unconsciousness",
+    "symptoms of heatstroke",
+    "my child has sunstroke",
+    "signs of heat stroke",
+    "is she having a STROKE",
+    "he had two strokes last year",
+    "feeling suicidal",
+    "history of parasuicide",
+    "she overdosed on pills",
+    "food poisoning after dinner",
+    "grand mal seizures",
+    "heart attacks in women",
+    "sudden chest pains",
+    "severe burns on the arm",
+    "difficulty\tbreathing at night",
+])
+def test_emergency_variants_are_high(query):
+    assert SafetyGuard.classify_risk(query)[0] == RiskLevel.HIGH
+
+
+@pytest.mark.parametrize("term", BASELINE_DIAGNOSTIC)
+def test_baseline_diagnostic_terms_are_moderate(term):
+    assert SafetyGuard.classify_risk(f"question about {term} for my knee")[0] == RiskLevel.MODERATE
+
+
+@pytest.mark.parametrize("query", [
+    "is physiotherapy worth it",
+    "asymptomatic carriers",
+    "coinfection rates",
+    "painful joints",
+])
+def test_diagnostic_variants_are_moderate(query):
+    assert SafetyGuard.classify_risk(query)[0] == RiskLevel.MODERATE
+
+
+@pytest.mark.parametrize("query", ["benefits of yoga", "how much water should I drink", "best sleep schedule"])
+def test_general_queries_are_low(query):
+    assert SafetyGuard.classify_risk(query)[0] == RiskLevel.LOW
+
+
+def test_matcher_reports_terms_in_text_order():
+    matcher = LexiconMatcher({RiskLevel.MODERATE: ["fever*", "do i have"], RiskLevel.HIGH: ["*stroke*"]})
+    assert matcher.find_all("Do I  have fevers after a heatstroke?") == [
+        ("do i have", RiskLevel.MODERATE),
+        ("fever*", RiskLevel.MODERATE),
+        ("*stroke*", RiskLevel.HIGH),
+    ]
+
+
+def test_matcher_respects_word_boundaries():
+    matcher = LexiconMatcher({RiskLevel.HIGH: ["rash", "burn*", "*stroke"]})
+    assert matcher.find_all("brash, sunburn, strokes") == []
+    assert matcher.find_all("rash, burns, heatstroke") == [
+        ("rash", RiskLevel.HIGH), ("burn*", RiskLevel.HIGH), ("*stroke", RiskLevel.HIGH),
+    ]
+
+
+def test_higher_risk_lexicon_wins_for_shared_terms():
+    matcher = LexiconMatcher({RiskLevel.MODERATE: ["chest pain"], RiskLevel.HIGH: ["chest pain"]})
+    assert matcher.find_all("chest pain") == [("chest pain", RiskLevel.HIGH)]
@@ -31,6 +31,18 @@ const UploadSidebar = () => {
 
       if (!response.ok) throw new Error('Upload failed');
 
+      // Indexing runs in the background; poll the job until it finishes
+      const { job_id } = await response.json();
+      let job;
+      do {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        const jobResponse = await fetch(`/api/jobs/${job_id}`);
+        if (!jobResponse.ok) throw new Error('Job status unavailable');
+        job = await jobResponse.json();
+      } while (job.status === 'queued' || job.status === 'running');
+
+      if (job.status !== 'done') throw new Error(job.message || 'Indexing failed');
+
       setUploadStatus('success');
       setFile(null);
       if (fileInputRef.current) fileInputRef.current.value = "";
@@ -106,7 +118,7 @@ const UploadSidebar = () => {
             : '0 4px 14px rgba(30, 41, 59, 0.3)',
         }}
       >
-        {isUploading ? 'Uploading...' : 'Upload & Index'}
+        {isUploading ? 'Indexing...' : 'Upload & Index'}
       </button>
 
       {uploadStatus === 'success' && (